@@ -0,0 +1,229 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+import argparse
+import json
+import sys
+import yaml
+
+from format_compile import FormatProcessor, TargetApp
+from profile_compile import process_profile
+
+
+@dataclass
+class CorpusGraph:
+    """Reference graph of profiles -> formats -> patterns"""
+    # Pattern name -> file path
+    patterns: Dict[str, Path] = field(default_factory=dict)
+    # Format name -> file stem, which is what the compiler loads by
+    format_files: Dict[str, str] = field(default_factory=dict)
+    # Format name -> referenced pattern names
+    format_patterns: Dict[str, Set[str]] = field(default_factory=dict)
+    # Profile name -> file path
+    profile_files: Dict[str, Path] = field(default_factory=dict)
+    # Profile name -> referenced format names
+    profile_formats: Dict[str, Set[str]] = field(default_factory=dict)
+
+    @classmethod
+    def scan(cls, patterns_dir: Path, formats_dir: Path,
+             profiles_dir: Optional[Path]) -> 'CorpusGraph':
+        graph = cls()
+        for file_path in sorted(patterns_dir.glob('*.yml')):
+            with file_path.open('r') as f:
+                graph.patterns[yaml.safe_load(f)['name']] = file_path
+
+        for file_path in sorted(formats_dir.glob('*.yml')):
+            with file_path.open('r') as f:
+                data = yaml.safe_load(f)
+            graph.format_files[data['name']] = file_path.stem
+            graph.format_patterns[data['name']] = {
+                condition['pattern']
+                for condition in data.get('conditions') or []
+                if condition.get('type') in ('release_title', 'release_group')
+                and 'pattern' in condition
+            }
+
+        if profiles_dir:
+            for file_path in sorted(profiles_dir.glob('*.yml')):
+                with file_path.open('r') as f:
+                    data = yaml.safe_load(f)
+                graph.profile_files[data['name']] = file_path
+                graph.profile_formats[data['name']] = {
+                    cf['name']
+                    for cf in data.get('custom_formats') or []
+                }
+        return graph
+
+    def referenced_patterns(self,
+                            formats: Optional[Iterable[str]] = None
+                            ) -> Set[str]:
+        formats = self.format_patterns if formats is None else formats
+        return set().union(*(self.format_patterns.get(name, set())
+                             for name in formats))
+
+    def referenced_formats(self,
+                           profiles: Optional[Iterable[str]] = None
+                           ) -> Set[str]:
+        profiles = self.profile_formats if profiles is None else profiles
+        return set().union(*(self.profile_formats.get(name, set())
+                             for name in profiles))
+
+    def coverage(self) -> Dict[str, object]:
+        used_patterns = self.referenced_patterns()
+        used_formats = self.referenced_formats()
+        missing_patterns = {}
+        for name, patterns in sorted(self.format_patterns.items()):
+            missing = sorted(patterns - set(self.patterns))
+            if missing:
+                missing_patterns[name] = missing
+        missing_formats = {}
+        for name, formats in sorted(self.profile_formats.items()):
+            missing = sorted(formats - set(self.format_files))
+            if missing:
+                missing_formats[name] = missing
+
+        report = {
+            'unused_patterns': sorted(set(self.patterns) - used_patterns),
+            'missing_patterns': missing_patterns,
+        }
+        if self.profile_files:
+            report['unreferenced_formats'] = sorted(
+                set(self.format_files) - used_formats)
+            report['missing_formats'] = missing_formats
+        return report
+
+    def closure(self, profiles: Iterable[str]):
+        """Formats and patterns reachable from the given profiles"""
+        formats = {
+            name
+            for name in self.referenced_formats(profiles)
+            if name in self.format_files
+        }
+        patterns = {
+            name
+            for name in self.referenced_patterns(formats)
+            if name in self.patterns
+        }
+        return formats, patterns
+
+
+def print_coverage(report: Dict[str, object]) -> None:
+    for key, value in report.items():
+        title = key.replace('_', ' ').capitalize()
+        print(f"\n{title}: {len(value)}")
+        if isinstance(value, dict):
+            for owner, names in value.items():
+                print(f"  {owner}: {', '.join(names)}")
+        else:
+            for name in value:
+                print(f"  {name}")
+
+
+def prune(graph: CorpusGraph, profiles: List[str], formats_dir: Path,
+          patterns_dir: Path, output_dir: Path, target_app: TargetApp,
+          single_file: bool) -> None:
+    formats, patterns = graph.closure(profiles)
+    print(f"Reachable from {len(profiles)} profile(s): "
+          f"{len(formats)}/{len(graph.format_files)} format(s), "
+          f"{len(patterns)}/{len(graph.patterns)} pattern(s)")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    processor = FormatProcessor(formats_dir,
+                                output_dir,
+                                patterns_dir,
+                                pattern_paths=[
+                                    graph.patterns[name]
+                                    for name in sorted(patterns)
+                                ])
+    processor.process_all_formats(
+        target_app,
+        single_file,
+        format_names={graph.format_files[name]
+                      for name in formats})
+
+    for name in profiles:
+        profile_path = graph.profile_files[name]
+        process_profile(profile_path, output_dir / f"{profile_path.stem}.json",
+                        target_app.app_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Report unused and missing patterns/formats, or compile only what profiles need'
+    )
+    parser.add_argument(
+        '--patterns-dir',
+        type=Path,
+        default=Path('regex_patterns'),
+        help=
+        'Directory containing regex pattern files (default: regex_patterns)')
+    parser.add_argument(
+        '--formats-dir',
+        type=Path,
+        default=Path('custom_formats'),
+        help=
+        'Directory containing custom format files (default: custom_formats)')
+    parser.add_argument('--profiles-dir',
+                        type=Path,
+                        default=Path('profiles'),
+                        help='Directory containing profile files '
+                        '(default: profiles)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    report = commands.add_parser('report', help='Print a coverage report')
+    report.add_argument('--json',
+                        action='store_true',
+                        help='Print the report as JSON')
+
+    pruned = commands.add_parser(
+        'prune', help='Compile only formats and patterns profiles reach')
+    pruned.add_argument(
+        '--profile',
+        action='append',
+        help='Profile name to include (repeatable, default: all profiles)')
+    group = pruned.add_mutually_exclusive_group(required=True)
+    group.add_argument('-r',
+                       '--radarr',
+                       action='store_true',
+                       help='Convert for Radarr')
+    group.add_argument('-s',
+                       '--sonarr',
+                       action='store_true',
+                       help='Convert for Sonarr')
+    pruned.add_argument('--output-dir',
+                        type=Path,
+                        default=Path('output'),
+                        help='Directory for output files (default: output)')
+    pruned.add_argument(
+        '--single-file',
+        action='store_true',
+        help='Output formats to a single JSON file instead of separate files'
+    )
+    args = parser.parse_args()
+
+    profiles_dir = args.profiles_dir if args.profiles_dir.exists() else None
+    graph = CorpusGraph.scan(args.patterns_dir, args.formats_dir,
+                             profiles_dir)
+
+    if args.command == 'report':
+        coverage = graph.coverage()
+        if args.json:
+            print(json.dumps(coverage, indent=2))
+        else:
+            print_coverage(coverage)
+        return
+
+    profiles = args.profile or sorted(graph.profile_files)
+    unknown = [name for name in profiles if name not in graph.profile_files]
+    if unknown:
+        print(f"Error: profile(s) not found: {', '.join(unknown)}")
+        sys.exit(1)
+
+    target_app = TargetApp.RADARR if args.radarr else TargetApp.SONARR
+    prune(graph, profiles, args.formats_dir, args.patterns_dir,
+          args.output_dir, target_app, args.single_file)
+
+
+if __name__ == '__main__':
+    main()
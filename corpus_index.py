@@ -0,0 +1,399 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import yaml
+
+from format_compile import FormatConverter, TargetApp
+from profile_compile import ProfileConverter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patterns (
+    name TEXT PRIMARY KEY,
+    pattern TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS formats (
+    name TEXT PRIMARY KEY,
+    description TEXT,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS format_tags (
+    format TEXT NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS specifications (
+    format TEXT NOT NULL,
+    app TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    condition_type TEXT,
+    implementation TEXT,
+    negate INTEGER NOT NULL,
+    required INTEGER NOT NULL,
+    pattern_name TEXT,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    name TEXT NOT NULL,
+    app TEXT NOT NULL,
+    path TEXT NOT NULL,
+    upgrade_allowed INTEGER,
+    min_format_score INTEGER,
+    cutoff_format_score INTEGER,
+    min_upgrade_format_score INTEGER,
+    cutoff INTEGER,
+    PRIMARY KEY (name, app)
+);
+CREATE TABLE IF NOT EXISTS profile_format_items (
+    profile TEXT NOT NULL,
+    app TEXT NOT NULL,
+    format_id INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    score INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_format_tags_tag ON format_tags (tag);
+CREATE INDEX IF NOT EXISTS idx_format_tags_format ON format_tags (format);
+CREATE INDEX IF NOT EXISTS idx_specs_format ON specifications (format);
+CREATE INDEX IF NOT EXISTS idx_specs_pattern ON specifications (pattern_name);
+CREATE INDEX IF NOT EXISTS idx_specs_type
+    ON specifications (condition_type, negate);
+CREATE INDEX IF NOT EXISTS idx_items_format
+    ON profile_format_items (format, score);
+CREATE INDEX IF NOT EXISTS idx_items_profile
+    ON profile_format_items (profile);
+"""
+
+class _PatternLookup:
+    """Resolves pattern names against the index for FormatConverter"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def get(self, name: str, default=None) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT pattern FROM patterns WHERE name = ?", (name, )).fetchone()
+        return row[0] if row else default
+
+
+class CorpusIndex:
+    """Incrementally maintained SQLite index of the compiled corpus.
+
+    Files are only re-parsed when their size or mtime changed and their
+    content hash differs from the indexed one. Formats referencing an edited,
+    added or removed pattern are re-indexed, so an incremental update always
+    yields the same rows as a full rebuild.
+    """
+
+    def __init__(self, database: Path):
+        self.connection = sqlite3.connect(str(database))
+        self.connection.executescript(SCHEMA)
+        self.converter = FormatConverter(_PatternLookup(self.connection))
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _changed_files(
+            self, kind: str,
+            directory: Path) -> Tuple[List[Tuple[Path, str]], List[str]]:
+        """Return (path, sha) pairs to reindex and indexed paths now gone"""
+        indexed = {
+            row[0]: row[1:]
+            for row in self.connection.execute(
+                "SELECT path, mtime_ns, size, sha FROM files WHERE kind = ?",
+                (kind, ))
+        }
+        changed = []
+        seen = set()
+        for file_path in sorted(directory.glob('*.yml')):
+            path = str(file_path)
+            seen.add(path)
+            stat = file_path.stat()
+            previous = indexed.get(path)
+            if previous and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            sha = hashlib.sha1(file_path.read_bytes()).hexdigest()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (path, kind, stat.st_mtime_ns, stat.st_size, sha))
+            if not previous or previous[2] != sha:
+                changed.append((file_path, sha))
+
+        removed = [path for path in indexed if path not in seen]
+        for path in removed:
+            self.connection.execute("DELETE FROM files WHERE path = ?",
+                                    (path, ))
+        return changed, removed
+
+    def _index_patterns(self, directory: Path) -> Set[str]:
+        """Reindex pattern files, returning the names whose value changed"""
+        changed, removed = self._changed_files('pattern', directory)
+        affected = set()
+        for path in removed + [str(p) for p, _ in changed]:
+            affected.update(row[0] for row in self.connection.execute(
+                "SELECT name FROM patterns WHERE path = ?", (path, )))
+            self.connection.execute("DELETE FROM patterns WHERE path = ?",
+                                    (path, ))
+
+        for file_path, _ in changed:
+            with file_path.open('r') as f:
+                data = yaml.safe_load(f)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO patterns VALUES (?, ?, ?)",
+                (data['name'], data['pattern'], str(file_path)))
+            affected.add(data['name'])
+        return affected
+
+    def _pattern_users(self, names: Set[str]) -> Set[str]:
+        """Paths of indexed formats referencing any of the pattern names"""
+        users = set()
+        for name in names:
+            users.update(row[0] for row in self.connection.execute(
+                "SELECT DISTINCT formats.path FROM formats JOIN "
+                "specifications ON specifications.format = formats.name "
+                "WHERE specifications.pattern_name = ?", (name, )))
+        return users
+
+    def _delete_formats(self, path: str) -> None:
+        for (name, ) in self.connection.execute(
+                "SELECT name FROM formats WHERE path = ?", (path, )).fetchall():
+            self.connection.execute("DELETE FROM format_tags WHERE format = ?",
+                                    (name, ))
+            self.connection.execute(
+                "DELETE FROM specifications WHERE format = ?", (name, ))
+        self.connection.execute("DELETE FROM formats WHERE path = ?",
+                                (path, ))
+
+    def _index_formats(self, directory: Path, patterns: Set[str]) -> int:
+        """Reindex changed format files and, since a specification's
+        implementation and value both depend on its pattern, every format
+        referencing one of the changed pattern names"""
+        changed, removed = self._changed_files('format', directory)
+        paths = [file_path for file_path, _ in changed]
+        reindexed = {str(file_path) for file_path in paths}
+        paths += sorted(
+            Path(path) for path in self._pattern_users(patterns)
+            if path not in reindexed and path not in removed)
+        for path in removed + [str(p) for p in paths]:
+            self._delete_formats(path)
+
+        for file_path in paths:
+            with file_path.open('r') as f:
+                data = yaml.safe_load(f)
+            name = data['name']
+            self.connection.execute(
+                "INSERT OR REPLACE INTO formats VALUES (?, ?, ?)",
+                (name, data.get('description'), str(file_path)))
+            self.connection.executemany(
+                "INSERT INTO format_tags VALUES (?, ?)",
+                [(name, tag) for tag in data.get('tags') or []])
+
+            for target_app in TargetApp:
+                app = target_app.app_name
+                for position, condition in enumerate(
+                        data.get('conditions') or []):
+                    spec = self.converter._create_specification(
+                        condition, target_app)
+                    value = spec.fields[0]['value'] if spec else None
+                    self.connection.execute(
+                        "INSERT INTO specifications VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (name, app, position, condition.get('name', ''),
+                         condition.get('type'),
+                         spec.implementation if spec else None,
+                         int(bool(condition.get('negate', False))),
+                         int(bool(condition.get('required', False))),
+                         condition.get('pattern'),
+                         None if value is None else str(value)))
+        return len(changed) + len(removed)
+
+    def _index_profiles(self, directory: Path) -> int:
+        changed, removed = self._changed_files('profile', directory)
+        for path in removed + [str(p) for p, _ in changed]:
+            for name, app in self.connection.execute(
+                    "SELECT name, app FROM profiles WHERE path = ?",
+                (path, )).fetchall():
+                self.connection.execute(
+                    "DELETE FROM profile_format_items "
+                    "WHERE profile = ? AND app = ?", (name, app))
+            self.connection.execute("DELETE FROM profiles WHERE path = ?",
+                                    (path, ))
+
+        for file_path, _ in changed:
+            with file_path.open('r') as f:
+                data = yaml.safe_load(f)
+            for target_app in TargetApp:
+                app = target_app.app_name
+                profile = ProfileConverter(app).convert_profile(data)
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO profiles VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?)",
+                    (profile['name'], app, str(file_path),
+                     int(profile['upgradeAllowed']),
+                     profile['minFormatScore'], profile['cutoffFormatScore'],
+                     profile['minUpgradeFormatScore'], profile.get('cutoff')))
+                self.connection.executemany(
+                    "INSERT INTO profile_format_items VALUES (?, ?, ?, ?, ?)",
+                    [(profile['name'], app, item['format'], item['name'],
+                      item['score']) for item in profile['formatItems']])
+        return len(changed) + len(removed)
+
+    def update(self, patterns_dir: Path, formats_dir: Path,
+               profiles_dir: Optional[Path]) -> Dict[str, int]:
+        with self.connection:
+            patterns = self._index_patterns(patterns_dir)
+            formats = self._index_formats(formats_dir, patterns)
+            profiles = (self._index_profiles(profiles_dir)
+                        if profiles_dir else 0)
+        return {
+            'patterns': len(patterns),
+            'formats': formats,
+            'profiles': profiles
+        }
+
+    def query(self, sql: str, params: Tuple = ()) -> Tuple[List[str], List]:
+        cursor = self.connection.execute(sql, params)
+        columns = [column[0] for column in cursor.description or []]
+        return columns, cursor.fetchall()
+
+
+QUERIES = {
+    'uses-pattern':
+    ("SELECT DISTINCT format, condition_type, name FROM specifications "
+     "WHERE pattern_name = ? ORDER BY format"),
+    'scores':
+    ("SELECT profile, app, score FROM profile_format_items "
+     "WHERE format = ? AND score > ? ORDER BY score DESC, profile, app"),
+    'conditions':
+    ("SELECT DISTINCT format, name, value FROM specifications "
+     "WHERE condition_type = ? AND negate >= ? AND app = ? ORDER BY format"),
+    'missing-patterns':
+    ("SELECT DISTINCT format, pattern_name FROM specifications "
+     "WHERE pattern_name IS NOT NULL AND value IS NULL ORDER BY format"),
+}
+
+
+def _print_rows(columns: List[str], rows: List, as_json: bool) -> None:
+    if as_json:
+        print(json.dumps([dict(zip(columns, row)) for row in rows], indent=2))
+        return
+    print('\t'.join(columns))
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Build and query a SQLite index of the compiled corpus')
+    parser.add_argument('--database',
+                        type=Path,
+                        default=Path('corpus.sqlite'),
+                        help='Index database file (default: corpus.sqlite)')
+    parser.add_argument('--json',
+                        action='store_true',
+                        help='Print query results as JSON')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update',
+                                 help='Create or incrementally refresh')
+    update.add_argument(
+        '--patterns-dir',
+        type=Path,
+        default=Path('regex_patterns'),
+        help=
+        'Directory containing regex pattern files (default: regex_patterns)')
+    update.add_argument(
+        '--formats-dir',
+        type=Path,
+        default=Path('custom_formats'),
+        help=
+        'Directory containing custom format files (default: custom_formats)')
+    update.add_argument(
+        '--profiles-dir',
+        type=Path,
+        help='Directory containing profile files (skipped if omitted)')
+
+    uses = commands.add_parser('uses-pattern',
+                               help='Formats using a regex pattern')
+    uses.add_argument('pattern', help='Pattern name')
+
+    scores = commands.add_parser('scores',
+                                 help='Profiles scoring a format above N')
+    scores.add_argument('format', help='Custom format name')
+    scores.add_argument('--above',
+                        type=int,
+                        default=0,
+                        help='Minimum score, exclusive (default: 0)')
+
+    conditions = commands.add_parser(
+        'conditions', help='Formats with a given condition type')
+    conditions.add_argument(
+        'type', help='Condition type, e.g. resolution or release_title')
+    conditions.add_argument('--negated',
+                            action='store_true',
+                            help='Only negated conditions')
+    conditions.add_argument('--app',
+                            choices=[app.app_name for app in TargetApp],
+                            default='Radarr',
+                            help='App whose resolved values to show')
+
+    commands.add_parser('missing-patterns',
+                        help='Conditions referencing unknown patterns')
+
+    sql = commands.add_parser('sql', help='Run a read-only SQL query')
+    sql.add_argument('query', help='SQL statement')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command != 'update' and not args.database.exists():
+        print(f"Error: index not found: {args.database} "
+              f"(run the update command first)")
+        sys.exit(1)
+
+    index = CorpusIndex(args.database)
+    try:
+        if args.command == 'update':
+            counts = index.update(args.patterns_dir, args.formats_dir,
+                                  args.profiles_dir)
+            print(f"Index updated: {args.database}")
+            for kind, count in counts.items():
+                print(f"  {kind} changed: {count}")
+            return
+
+        if args.command == 'uses-pattern':
+            params = (args.pattern, )
+        elif args.command == 'scores':
+            params = (args.format, args.above)
+        elif args.command == 'conditions':
+            params = (args.type, int(args.negated), args.app)
+        else:
+            params = ()
+
+        try:
+            if args.command == 'sql':
+                index.connection.execute('PRAGMA query_only = ON')
+                columns, rows = index.query(args.query)
+            else:
+                columns, rows = index.query(QUERIES[args.command], params)
+        except sqlite3.Error as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+        _print_rows(columns, rows, args.json)
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,639 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import argparse
+import os
+import re
+import sys
+import yaml
+
+from format_compile import TargetApp, ValueResolver
+from profile_compile import QualityMappings
+
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+SCALAR_TAGS = {
+    'str': ('tag:yaml.org,2002:str', 'a string'),
+    'int': ('tag:yaml.org,2002:int', 'an integer'),
+    'bool': ('tag:yaml.org,2002:bool', 'a boolean'),
+}
+
+
+@dataclass(frozen=True)
+class Issue:
+    path: str
+    line: int
+    severity: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.path}:{self.line}: {self.severity}: {self.message}"
+
+
+@dataclass
+class ValidationContext:
+    """Names and value tables the validators check references against"""
+    target_apps: Tuple[TargetApp, ...] = (TargetApp.RADARR, TargetApp.SONARR)
+    patterns: Set[str] = field(default_factory=set)
+    formats: Set[str] = field(default_factory=set)
+
+
+Validator = Callable[[yaml.Node, str, List[Issue], ValidationContext], None]
+
+
+def _line(node: yaml.Node) -> int:
+    return node.start_mark.line + 1
+
+
+def _report(issues: List[Issue], path: str, node: yaml.Node, severity: str,
+            message: str) -> None:
+    issues.append(Issue(path, _line(node), severity, message))
+
+
+def compile_schema(schema: Dict) -> Validator:
+    """Turn a declarative schema into a validator closure.
+
+    Schemas are compiled once per process so validating a file is just a
+    walk of its node tree with no per-file schema interpretation.
+    """
+    kind = schema['type']
+    label = schema.get('label', kind)
+
+    if kind == 'any':
+        return lambda node, path, issues, context: None
+
+    if kind in SCALAR_TAGS:
+        tag, description = SCALAR_TAGS[kind]
+        check = schema.get('check')
+
+        def validate_scalar(node, path, issues, context):
+            if not isinstance(node, yaml.ScalarNode) or node.tag != tag:
+                _report(issues, path, node, 'error',
+                        f"{label} must be {description}")
+            elif check:
+                check(node, path, issues, context)
+
+        return validate_scalar
+
+    if kind == 'list':
+        item_validator = compile_schema(schema['items'])
+
+        def validate_list(node, path, issues, context):
+            if not isinstance(node, yaml.SequenceNode):
+                _report(issues, path, node, 'error', f"{label} must be a list")
+                return
+            for item in node.value:
+                item_validator(item, path, issues, context)
+
+        return validate_list
+
+    if kind == 'map':
+        keys = {
+            name: (compile_schema(key_schema), required)
+            for name, (key_schema, required) in schema['keys'].items()
+        }
+        required_keys = [name for name, (_, req) in keys.items() if req]
+        extra = schema.get('extra', 'error')
+        check = schema.get('check')
+
+        def validate_map(node, path, issues, context):
+            if not isinstance(node, yaml.MappingNode):
+                _report(issues, path, node, 'error',
+                        f"{label} must be a mapping")
+                return
+            seen = {}
+            for key_node, value_node in node.value:
+                if not isinstance(key_node, yaml.ScalarNode):
+                    _report(issues, path, key_node, 'error',
+                            f"{label} keys must be strings")
+                    continue
+                key = key_node.value
+                seen[key] = value_node
+                if key in keys:
+                    keys[key][0](value_node, path, issues, context)
+                elif extra != 'allow':
+                    _report(issues, path, key_node, extra,
+                            f"unexpected key '{key}' in {label}")
+            for key in required_keys:
+                if key not in seen:
+                    _report(issues, path, node, 'error',
+                            f"{label} is missing required key '{key}'")
+            if check:
+                check(node, seen, path, issues, context)
+
+        return validate_map
+
+    if kind == 'tagged':
+        # Mapping whose schema is picked by the value of a discriminator key
+        discriminator = schema['key']
+        variants = {
+            name: compile_schema(variant)
+            for name, variant in schema['variants'].items()
+        }
+
+        def validate_tagged(node, path, issues, context):
+            if not isinstance(node, yaml.MappingNode):
+                _report(issues, path, node, 'error',
+                        f"{label} must be a mapping")
+                return
+            for key_node, value_node in node.value:
+                if not (isinstance(key_node, yaml.ScalarNode)
+                        and key_node.value == discriminator):
+                    continue
+                if not isinstance(value_node, yaml.ScalarNode):
+                    _report(issues, path, value_node, 'error',
+                            f"{label} {discriminator} must be a string")
+                    return
+                variant = variants.get(value_node.value)
+                if variant is None:
+                    _report(
+                        issues, path, value_node, 'error',
+                        f"unknown {label} {discriminator} "
+                        f"'{value_node.value}'")
+                    return
+                variant(node, path, issues, context)
+                return
+            _report(issues, path, node, 'error',
+                    f"{label} is missing required key '{discriminator}'")
+
+        return validate_tagged
+
+    raise ValueError(f"Unknown schema type: {kind}")
+
+
+def _value_check(tables: Callable[[TargetApp], Dict],
+                 what: str,
+                 normalize: Callable[[str], str] = str,
+                 consequence: str = 'resolves to 0') -> Callable:
+    """Check a scalar against per-app value tables, as ValueResolver would"""
+
+    def check(node, path, issues, context):
+        value = normalize(node.value)
+        known = [app for app in context.target_apps if value in tables(app)]
+        if not known:
+            _report(issues, path, node, 'error',
+                    f"unknown {what} '{node.value}' ({consequence})")
+        elif len(known) < len(context.target_apps):
+            missing = ', '.join(app.name.title()
+                                for app in context.target_apps
+                                if app not in known)
+            _report(issues, path, node, 'warning',
+                    f"{what} '{node.value}' is not defined for {missing}")
+
+    return check
+
+
+def _check_pattern_reference(node, path, issues, context):
+    if node.value not in context.patterns:
+        _report(issues, path, node, 'error',
+                f"pattern '{node.value}' not found in patterns directory")
+
+
+def _check_format_reference(node, path, issues, context):
+    if node.value not in context.formats:
+        _report(issues, path, node, 'error',
+                f"custom format '{node.value}' not found in formats directory")
+
+
+def _check_regex(node, path, issues, context):
+    try:
+        re.compile(node.value)
+    except re.error as error:
+        # Radarr/Sonarr use .NET regex, so this is only a hint
+        _report(issues, path, node, 'warning',
+                f"pattern does not compile as a Python regex: {error}")
+
+
+_quality_check = _value_check(lambda app: QualityMappings.RADARR
+                              if app == TargetApp.RADARR else
+                              QualityMappings.SONARR,
+                              'quality',
+                              consequence='skipped by convert_profile')
+
+
+COMMON_CONDITION_KEYS = {
+    'name': ({
+        'type': 'str',
+        'label': 'condition name'
+    }, False),
+    'type': ({
+        'type': 'str'
+    }, True),
+    'negate': ({
+        'type': 'bool',
+        'label': 'negate'
+    }, False),
+    'required': ({
+        'type': 'bool',
+        'label': 'required'
+    }, False),
+}
+
+
+def _condition(extra_keys: Dict) -> Dict:
+    return {
+        'type': 'map',
+        'label': 'condition',
+        'keys': {
+            **COMMON_CONDITION_KEYS,
+            **extra_keys
+        },
+        'extra': 'warning'
+    }
+
+
+PATTERN_SCHEMA = {
+    'type': 'map',
+    'label': 'pattern',
+    'keys': {
+        'name': ({
+            'type': 'str',
+            'label': 'name'
+        }, True),
+        'pattern': ({
+            'type': 'str',
+            'label': 'pattern',
+            'check': _check_regex
+        }, True),
+    },
+    'extra': 'allow'
+}
+
+PATTERN_REFERENCE = {
+    'type': 'str',
+    'label': 'pattern',
+    'check': _check_pattern_reference
+}
+
+FORMAT_SCHEMA = {
+    'type': 'map',
+    'label': 'custom format',
+    'keys': {
+        'name': ({
+            'type': 'str',
+            'label': 'name'
+        }, True),
+        'description': ({
+            'type': 'any'
+        }, True),
+        'tags': ({
+            'type': 'list',
+            'label': 'tags',
+            'items': {
+                'type': 'str',
+                'label': 'tag'
+            }
+        }, True),
+        'conditions': ({
+            'type': 'list',
+            'label': 'conditions',
+            'items': {
+                'type': 'tagged',
+                'label': 'condition',
+                'key': 'type',
+                'variants': {
+                    'release_title':
+                    _condition({'pattern': (PATTERN_REFERENCE, True)}),
+                    'release_group':
+                    _condition({'pattern': (PATTERN_REFERENCE, True)}),
+                    'source':
+                    _condition({
+                        'source': ({
+                            'type':
+                            'str',
+                            'label':
+                            'source',
+                            'check':
+                            _value_check(
+                                lambda app: ValueResolver.RADARR_SOURCES
+                                if app == TargetApp.RADARR else
+                                ValueResolver.SONARR_SOURCES, 'source')
+                        }, True)
+                    }),
+                    'resolution':
+                    _condition({
+                        'resolution': ({
+                            'type':
+                            'str',
+                            'label':
+                            'resolution',
+                            'check':
+                            _value_check(lambda app: ValueResolver.RESOLUTIONS,
+                                         'resolution')
+                        }, True)
+                    }),
+                    'indexer_flag':
+                    _condition({
+                        'flag': ({
+                            'type':
+                            'str',
+                            'label':
+                            'flag',
+                            'check':
+                            _value_check(
+                                lambda app: ValueResolver.RADARR_INDEXER_FLAGS
+                                if app == TargetApp.RADARR else
+                                ValueResolver.SONARR_INDEXER_FLAGS,
+                                'indexer flag', str.lower)
+                        }, True)
+                    }),
+                }
+            }
+        }, True),
+        'tests': ({
+            'type': 'list',
+            'label': 'tests',
+            'items': {
+                'type': 'any'
+            }
+        }, True),
+    },
+    'extra': 'error'
+}
+
+QUALITY_REFERENCE = {
+    'type': 'map',
+    'label': 'quality',
+    'keys': {
+        'name': ({
+            'type': 'str',
+            'label': 'quality name',
+            'check': _quality_check
+        }, True),
+        'id': ({
+            'type': 'int',
+            'label': 'quality id'
+        }, False),
+    },
+    'extra': 'allow'
+}
+
+
+def _check_quality_entry(node, seen, path, issues, context):
+    # Groups carry their own qualities; standalone entries must be real
+    # qualities or convert_profile drops them
+    if 'qualities' not in seen and 'name' in seen:
+        _quality_check(seen['name'], path, issues, context)
+
+
+PROFILE_SCHEMA = {
+    'type': 'map',
+    'label': 'profile',
+    'keys': {
+        'name': ({
+            'type': 'str',
+            'label': 'name'
+        }, True),
+        'upgradesAllowed': ({
+            'type': 'bool',
+            'label': 'upgradesAllowed'
+        }, False),
+        'minCustomFormatScore': ({
+            'type': 'int',
+            'label': 'minCustomFormatScore'
+        }, False),
+        'upgradeUntilScore': ({
+            'type': 'int',
+            'label': 'upgradeUntilScore'
+        }, False),
+        'minScoreIncrement': ({
+            'type': 'int',
+            'label': 'minScoreIncrement'
+        }, False),
+        'qualities': ({
+            'type': 'list',
+            'label': 'qualities',
+            'items': {
+                'type': 'map',
+                'label': 'quality entry',
+                'keys': {
+                    'name': ({
+                        'type': 'str',
+                        'label': 'quality entry name'
+                    }, True),
+                    'id': ({
+                        'type': 'int',
+                        'label': 'quality entry id'
+                    }, False),
+                    'qualities': ({
+                        'type': 'list',
+                        'label': 'group qualities',
+                        'items': QUALITY_REFERENCE
+                    }, False),
+                },
+                'extra': 'allow',
+                'check': _check_quality_entry
+            }
+        }, False),
+        'upgrade_until': ({
+            'type': 'map',
+            'label': 'upgrade_until',
+            'keys': {
+                'id': ({
+                    'type': 'int',
+                    'label': 'upgrade_until id'
+                }, True)
+            },
+            'extra': 'allow'
+        }, False),
+        'custom_formats': ({
+            'type': 'list',
+            'label': 'custom_formats',
+            'items': {
+                'type': 'map',
+                'label': 'custom format score',
+                'keys': {
+                    'name': ({
+                        'type': 'str',
+                        'label': 'custom format name',
+                        'check': _check_format_reference
+                    }, True),
+                    'score': ({
+                        'type': 'int',
+                        'label': 'score'
+                    }, True),
+                },
+                'extra': 'warning'
+            }
+        }, False),
+    },
+    'extra': 'allow'
+}
+
+VALIDATORS = {
+    'pattern': compile_schema(PATTERN_SCHEMA),
+    'format': compile_schema(FORMAT_SCHEMA),
+    'profile': compile_schema(PROFILE_SCHEMA),
+}
+
+_worker_context = ValidationContext()
+
+
+def _init_worker(context: ValidationContext) -> None:
+    global _worker_context
+    _worker_context = context
+
+
+def _declared_name(node: yaml.Node) -> Optional[Tuple[str, int]]:
+    if isinstance(node, yaml.MappingNode):
+        for key_node, value_node in node.value:
+            if key_node.value == 'name' and isinstance(value_node,
+                                                       yaml.ScalarNode):
+                return value_node.value, _line(value_node)
+    return None
+
+
+def validate_file(kind: str, file_path: Path) -> Tuple[List[Issue], Optional[
+        Tuple[str, int]]]:
+    """Validate one file, returning its issues and declared name"""
+    path = str(file_path)
+    issues = []
+    try:
+        node = yaml.compose(file_path.read_text(), Loader=YAML_LOADER)
+    except yaml.MarkedYAMLError as error:
+        mark = error.problem_mark or error.context_mark
+        line = mark.line + 1 if mark else 1
+        return [Issue(path, line, 'error', f"invalid YAML: {error.problem}")
+                ], None
+    except (OSError, yaml.YAMLError) as error:
+        return [Issue(path, 1, 'error', f"unreadable file: {error}")], None
+
+    if node is None:
+        return [Issue(path, 1, 'error', 'file is empty')], None
+
+    VALIDATORS[kind](node, path, issues, _worker_context)
+    return issues, _declared_name(node)
+
+
+def _validate_task(task: Tuple[str, Path]):
+    return validate_file(*task)
+
+
+class CorpusValidator:
+
+    def __init__(self,
+                 patterns_dir: Path,
+                 formats_dir: Path,
+                 profiles_dir: Optional[Path] = None,
+                 target_apps: Tuple[TargetApp, ...] = (TargetApp.RADARR,
+                                                       TargetApp.SONARR),
+                 jobs: Optional[int] = None):
+        self.patterns_dir = patterns_dir
+        self.formats_dir = formats_dir
+        self.profiles_dir = profiles_dir
+        self.context = ValidationContext(target_apps=target_apps)
+        self.jobs = jobs or os.cpu_count() or 1
+
+    def _run(self, kind: str, directory: Path):
+        paths = sorted(directory.glob('*.yml'))
+        tasks = [(kind, path) for path in paths]
+        if self.jobs == 1 or len(tasks) < 2:
+            _init_worker(self.context)
+            results = [_validate_task(task) for task in tasks]
+        else:
+            chunksize = max(1, len(tasks) // (self.jobs * 4))
+            with ProcessPoolExecutor(max_workers=self.jobs,
+                                     initializer=_init_worker,
+                                     initargs=(self.context, )) as executor:
+                results = list(
+                    executor.map(_validate_task, tasks, chunksize=chunksize))
+        return list(zip(paths, results))
+
+    @staticmethod
+    def _collect_names(kind: str, results, issues: List[Issue]) -> Set[str]:
+        names = {}
+        for path, (file_issues, declared) in results:
+            issues.extend(file_issues)
+            if not declared:
+                continue
+            name, line = declared
+            if name in names:
+                issues.append(
+                    Issue(str(path), line, 'error',
+                          f"duplicate {kind} name '{name}' "
+                          f"(also in {names[name]})"))
+            else:
+                names[name] = path
+        return set(names)
+
+    def validate(self) -> List[Issue]:
+        """Validate patterns, then formats, then profiles in one pass each"""
+        issues = []
+        self.context.patterns = self._collect_names(
+            'pattern', self._run('pattern', self.patterns_dir), issues)
+
+        # Profiles reference formats by the declared name convert_profile
+        # emits into formatItems, not by file name
+        self.context.formats = self._collect_names(
+            'format', self._run('format', self.formats_dir), issues)
+
+        if self.profiles_dir:
+            self._collect_names('profile',
+                                self._run('profile', self.profiles_dir),
+                                issues)
+        return issues
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Validate Profilarr pattern, custom format and profile YAML files')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-r',
+                       '--radarr',
+                       action='store_true',
+                       help='Only check values against Radarr')
+    group.add_argument('-s',
+                       '--sonarr',
+                       action='store_true',
+                       help='Only check values against Sonarr')
+    parser.add_argument(
+        '--patterns-dir',
+        type=Path,
+        default=Path('regex_patterns'),
+        help=
+        'Directory containing regex pattern files (default: regex_patterns)')
+    parser.add_argument(
+        '--formats-dir',
+        type=Path,
+        default=Path('custom_formats'),
+        help=
+        'Directory containing custom format files (default: custom_formats)')
+    parser.add_argument(
+        '--profiles-dir',
+        type=Path,
+        help='Directory containing profile files (skipped if omitted)')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--no-warnings',
+                        action='store_true',
+                        help='Only report errors')
+    args = parser.parse_args()
+
+    if args.radarr:
+        target_apps = (TargetApp.RADARR, )
+    elif args.sonarr:
+        target_apps = (TargetApp.SONARR, )
+    else:
+        target_apps = (TargetApp.RADARR, TargetApp.SONARR)
+
+    validator = CorpusValidator(args.patterns_dir, args.formats_dir,
+                                args.profiles_dir, target_apps, args.jobs)
+    issues = validator.validate()
+    if args.no_warnings:
+        issues = [issue for issue in issues if issue.severity == 'error']
+
+    for issue in sorted(issues, key=lambda i: (i.path, i.line)):
+        print(issue)
+
+    errors = sum(1 for issue in issues if issue.severity == 'error')
+    warnings = len(issues) - errors
+    print(f"\nValidation complete: {errors} error(s), {warnings} warning(s)")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
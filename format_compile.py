@@ -1,16 +1,29 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
 import argparse
+import hashlib
+import inspect
 import json
+import queue
+import textwrap
+import threading
 import yaml
 
+from profile_compile import ProfileConverter
+from regex_optimize import PatternOptimizer
+
 
 class TargetApp(Enum):
     RADARR = auto()
     SONARR = auto()
 
+    @property
+    def app_name(self) -> str:
+        """The app name as ProfileConverter and compiled profiles use it"""
+        return self.name.title()
+
 
 @dataclass
 class Specification:
@@ -40,6 +53,22 @@ class ConvertedFormat:
     specifications: List[Specification]
 
 
+def format_output(converted_format: ConvertedFormat) -> Dict:
+    """The JSON shape a compiled format is written in"""
+    return {
+        'name': converted_format.name,
+        'specifications':
+        [vars(spec) for spec in converted_format.specifications]
+    }
+
+
+@dataclass
+class CompiledCorpus:
+    """Compiled output keyed by format file stem and profile name"""
+    formats: Dict[str, Dict] = field(default_factory=dict)
+    profiles: Dict[str, Dict] = field(default_factory=dict)
+
+
 class ValueResolver:
     RADARR_INDEXER_FLAGS = {
         'freeleech': 1,
@@ -116,8 +145,11 @@ class ValueResolver:
 
 class FormatConverter:
 
-    def __init__(self, patterns: Dict[str, str]):
+    def __init__(self,
+                 patterns: Dict[str, str],
+                 optimizer: Optional[PatternOptimizer] = None):
         self.patterns = patterns
+        self.optimizer = optimizer
 
     def _create_specification(
             self, condition: Dict,
@@ -169,22 +201,51 @@ class FormatConverter:
             if spec:
                 specifications.append(spec)
 
+        if self.optimizer:
+            specifications = self.optimizer.optimize(custom_format.name,
+                                                     custom_format.tests,
+                                                     specifications)
+
         return ConvertedFormat(name=custom_format.name,
                                specifications=specifications)
 
 
+def source_digest(*objects) -> str:
+    """Digest of the source files defining objects, so that caches keyed on
+    it are invalidated whenever the compiler code changes"""
+    sha = hashlib.sha256()
+    for source in sorted({inspect.getsourcefile(obj) for obj in objects}):
+        sha.update(Path(source).read_bytes())
+    return sha.hexdigest()
+
+
+# Cached compiled output is only valid for the compiler code that produced it
+COMPILER_DIGEST = source_digest(FormatConverter, ProfileConverter)
+
+
 class FormatProcessor:
 
-    def __init__(self, input_dir: Path, output_dir: Path, patterns_dir: Path):
+    def __init__(self,
+                 input_dir: Path,
+                 output_dir: Path,
+                 patterns_dir: Path,
+                 optimizer: Optional[PatternOptimizer] = None,
+                 pattern_paths: Optional[Iterable[Path]] = None):
         self.input_dir = input_dir
         self.output_dir = output_dir
-        self.patterns = self._load_patterns(patterns_dir)
-        self.converter = FormatConverter(self.patterns)
+        self.patterns = self._load_patterns(patterns_dir, pattern_paths)
+        self.converter = FormatConverter(self.patterns, optimizer)
 
     @staticmethod
-    def _load_patterns(patterns_dir: Path) -> Dict[str, str]:
+    def _load_patterns(
+            patterns_dir: Path,
+            paths: Optional[Iterable[Path]] = None) -> Dict[str, str]:
+        """Load all patterns, or only the given pattern files"""
+        if paths is None:
+            paths = patterns_dir.glob('*.yml')
+
         patterns = {}
-        for file_path in patterns_dir.glob('*.yml'):
+        for file_path in paths:
             with file_path.open('r') as f:
                 pattern_data = yaml.safe_load(f)
                 patterns[pattern_data['name']] = pattern_data['pattern']
@@ -215,12 +276,7 @@ class FormatProcessor:
         if return_data:
             return converted_format
 
-        output_data = [{
-            'name':
-            converted_format.name,
-            'specifications':
-            [vars(spec) for spec in converted_format.specifications]
-        }]
+        output_data = [format_output(converted_format)]
 
         output_path = self.output_dir / f"{format_name}.json"
         with output_path.open('w') as f:
@@ -231,41 +287,192 @@ class FormatProcessor:
 
     def process_all_formats(self,
                             target_app: TargetApp,
-                            single_file: bool = False) -> None:
-        successful = 0
-        failed = 0
-        all_formats = []
-
-        for format_path in self.input_dir.glob('*.yml'):
-            format_name = format_path.stem
-            converted_format = self.process_format(format_name,
-                                                   target_app,
-                                                   return_data=single_file)
-
-            if converted_format:
-                if single_file:
-                    all_formats.append({
-                        'name':
-                        converted_format.name,
-                        'specifications': [
-                            vars(spec)
-                            for spec in converted_format.specifications
-                        ]
-                    })
-                successful += 1
-            else:
-                failed += 1
+                            single_file: bool = False,
+                            queue_size: int = 64,
+                            memory_limit: Optional[int] = None,
+                            format_names: Optional[Set[str]] = None) -> None:
+        pipeline = FormatPipeline(self, target_app, single_file, queue_size,
+                                  memory_limit, format_names)
+        successful = pipeline.run()
 
-        if single_file and all_formats:
-            output_path = self.output_dir / f"{target_app.name.lower()}_custom_formats.json"
-            with output_path.open('w') as f:
-                json.dump(all_formats, f, indent=2)
-            print(f"\nCombined output generated: {output_path}")
+        if single_file and successful:
+            print(f"\nCombined output generated: {pipeline.combined_path}")
 
         print(f"\nProcessing complete!")
         print(f"Successfully processed: {successful} format(s)")
-        if failed > 0:
-            print(f"Failed to process: {failed} format(s)")
+        if pipeline.failed > 0:
+            print(f"Failed to process: {pipeline.failed} format(s)")
+
+
+class MemoryBudget:
+    """Caps the bytes held by formats in flight between pipeline stages"""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        if self.limit is None:
+            return
+        with self._condition:
+            # A single oversized format is still let through on its own
+            while self.used and self.used + size > self.limit:
+                self._condition.wait()
+            self.used += size
+
+    def release(self, size: int) -> None:
+        if self.limit is None:
+            return
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+@dataclass
+class _PipelineItem:
+    path: Path
+    size: int
+    payload: object = None
+
+
+class _StageError:
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_STAGE_DONE = object()
+
+
+class FormatPipeline:
+    """Streams formats through discover -> read -> parse -> convert ->
+    serialize -> write, with bounded queues between stages so a slow stage
+    applies backpressure instead of letting the corpus pile up in memory."""
+
+    def __init__(self,
+                 processor: FormatProcessor,
+                 target_app: TargetApp,
+                 single_file: bool = False,
+                 queue_size: int = 64,
+                 memory_limit: Optional[int] = None,
+                 format_names: Optional[Set[str]] = None):
+        self.processor = processor
+        self.target_app = target_app
+        self.single_file = single_file
+        self.queue_size = max(1, queue_size)
+        self.budget = MemoryBudget(memory_limit)
+        self.format_names = format_names
+        self.failed = 0
+        self.combined_path = (
+            processor.output_dir /
+            f"{target_app.name.lower()}_custom_formats.json")
+
+    def _buffered(self, stage: Iterator) -> Iterator:
+        """Run a stage in its own thread behind a bounded queue"""
+        buffer = queue.Queue(maxsize=self.queue_size)
+
+        def pump():
+            try:
+                for item in stage:
+                    buffer.put(item)
+            except BaseException as error:
+                buffer.put(_StageError(error))
+            buffer.put(_STAGE_DONE)
+
+        threading.Thread(target=pump, daemon=True).start()
+        while True:
+            item = buffer.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+
+    def discover(self) -> Iterator[Path]:
+        if self.format_names is None:
+            yield from self.processor.input_dir.glob('*.yml')
+            return
+        for format_name in sorted(self.format_names):
+            format_path = self.processor.input_dir / f"{format_name}.yml"
+            if format_path.exists():
+                yield format_path
+            else:
+                print(f"Error: Custom format file not found: {format_path}")
+                self.failed += 1
+
+    def read(self, paths: Iterator[Path]) -> Iterator[_PipelineItem]:
+        for path in paths:
+            size = path.stat().st_size
+            self.budget.acquire(size)
+            yield _PipelineItem(path, size, path.read_text())
+
+    def parse(self, items: Iterator[_PipelineItem]) -> Iterator[_PipelineItem]:
+        for item in items:
+            item.payload = CustomFormat(**yaml.safe_load(item.payload))
+            yield item
+
+    def convert(self,
+                items: Iterator[_PipelineItem]) -> Iterator[_PipelineItem]:
+        for item in items:
+            item.payload = self.processor.converter.convert_format(
+                item.payload, self.target_app)
+            yield item
+
+    def serialize(self,
+                  items: Iterator[_PipelineItem]) -> Iterator[_PipelineItem]:
+        for item in items:
+            output_data = format_output(item.payload)
+            if self.single_file:
+                # Matches the layout json.dump(list, indent=2) would produce
+                item.payload = textwrap.indent(
+                    json.dumps(output_data, indent=2), '  ')
+            else:
+                item.payload = json.dumps([output_data], indent=2)
+            yield item
+
+    def write(self, items: Iterator[_PipelineItem]) -> int:
+        written = 0
+        combined = None
+        # The combined file is assembled next to its destination and only
+        # moved into place once every format made it through
+        partial_path = self.combined_path.with_name(self.combined_path.name +
+                                                    '.partial')
+        try:
+            for item in items:
+                print(f"\nProcessing: {item.path.stem}")
+                if self.single_file:
+                    if combined is None:
+                        combined = partial_path.open('w')
+                        combined.write('[\n')
+                    else:
+                        combined.write(',\n')
+                    combined.write(item.payload)
+                else:
+                    output_path = (self.processor.output_dir /
+                                   f"{item.path.stem}.json")
+                    output_path.write_text(item.payload)
+                    print(f"Output generated: {output_path}")
+                written += 1
+                self.budget.release(item.size)
+        except BaseException:
+            if combined is not None:
+                combined.close()
+                partial_path.unlink()
+            raise
+
+        if combined is not None:
+            combined.write('\n]')
+            combined.close()
+            partial_path.replace(self.combined_path)
+        return written
+
+    def run(self) -> int:
+        """Returns the number of formats written"""
+        stages = self._buffered(self.discover())
+        for stage in (self.read, self.parse, self.convert, self.serialize):
+            stages = self._buffered(stage(stages))
+        return self.write(stages)
 
 
 def parse_args() -> argparse.Namespace:
@@ -310,7 +517,35 @@ def parse_args() -> argparse.Namespace:
         action='store_true',
         help=
         'Output all formats to a single JSON file instead of separate files')
-    return parser.parse_args()
+    parser.add_argument(
+        '--optimize-patterns',
+        action='store_true',
+        help=
+        'Rewrite large release_title/release_group alternations into prefix-shared equivalents and merge compatible conditions'
+    )
+    parser.add_argument(
+        '--sample-corpus',
+        type=Path,
+        help=
+        'File with one release title per line, used to verify and benchmark optimized patterns (required with --optimize-patterns)'
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=64,
+        help='Maximum formats buffered between pipeline stages (default: 64)')
+    parser.add_argument(
+        '--memory-limit',
+        type=int,
+        help=
+        'Maximum megabytes of format data in flight through the pipeline (default: unlimited). Counts YAML source bytes, not the parsed and converted objects, so the ceiling is approximate'
+    )
+    args = parser.parse_args()
+    if args.optimize_patterns and not args.sample_corpus:
+        parser.error('--optimize-patterns requires --sample-corpus')
+    if args.memory_limit is not None and args.memory_limit <= 0:
+        parser.error('--memory-limit must be a positive number of megabytes')
+    return args
 
 
 def main():
@@ -319,14 +554,25 @@ def main():
 
     args.output_dir.mkdir(exist_ok=True)
 
+    optimizer = None
+    if args.optimize_patterns:
+        optimizer = PatternOptimizer(
+            PatternOptimizer.load_corpus(args.sample_corpus))
+
     processor = FormatProcessor(args.input_dir, args.output_dir,
-                                args.patterns_dir)
+                                args.patterns_dir, optimizer)
 
     if args.format_name:
         processor.process_format(args.format_name, target_app,
                                  args.single_file)
     else:
-        processor.process_all_formats(target_app, args.single_file)
+        memory_limit = (args.memory_limit * 1024 * 1024
+                        if args.memory_limit is not None else None)
+        processor.process_all_formats(target_app, args.single_file,
+                                      args.queue_size, memory_limit)
+
+    if optimizer:
+        optimizer.print_report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,339 @@
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import yaml
+
+from format_compile import (COMPILER_DIGEST, CompiledCorpus, CustomFormat,
+                            FormatConverter, TargetApp, format_output)
+from profile_compile import ProfileConverter
+
+
+class GitObjects:
+    """Reads trees and blobs from a local repository without a checkout"""
+
+    def __init__(self, repo: Path):
+        self.repo = repo
+        self._cat_file: Optional[subprocess.Popen] = None
+
+    def _git(self, *args: str) -> str:
+        result = subprocess.run(['git', '-C', str(self.repo), *args],
+                                check=True,
+                                capture_output=True,
+                                text=True)
+        return result.stdout
+
+    def resolve(self, rev: str) -> str:
+        return self._git('rev-parse', '--verify', f"{rev}^{{commit}}").strip()
+
+    def list_blobs(self, commit: str, directory: str) -> List[Tuple[str, str]]:
+        """Return (path, blob sha) for the *.yml files directly in directory"""
+        blobs = []
+        output = self._git('ls-tree', '-z', commit, '--', f"{directory}/")
+        for entry in filter(None, output.split('\0')):
+            info, path = entry.split('\t', 1)
+            _, kind, sha = info.split()
+            if kind == 'blob' and path.endswith('.yml'):
+                blobs.append((path, sha))
+        return blobs
+
+    def read_blob(self, sha: str) -> bytes:
+        if self._cat_file is None:
+            self._cat_file = subprocess.Popen(
+                ['git', '-C', str(self.repo), 'cat-file', '--batch'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE)
+        self._cat_file.stdin.write(f"{sha}\n".encode())
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline().decode().split()
+        if len(header) < 3 or header[1] == 'missing':
+            raise KeyError(f"Blob not found: {sha}")
+        data = self._cat_file.stdout.read(int(header[2]))
+        self._cat_file.stdout.read(1)
+        return data
+
+    def close(self) -> None:
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file = None
+
+
+class GitCompiler:
+    """Compiles formats and profiles from a git revision's tree objects.
+
+    Parsed YAML is cached by blob SHA, compiled formats by their blob SHA
+    plus the values of the patterns they reference, and compiled profiles
+    by blob SHA, so files unchanged between revisions are never recompiled.
+    With a cache directory the compiled results also persist across runs;
+    keys include the compiler source digest, so code changes invalidate
+    them.
+    """
+
+    def __init__(self,
+                 repo: Path,
+                 target_app: TargetApp,
+                 formats_dir: str = 'custom_formats',
+                 patterns_dir: str = 'regex_patterns',
+                 profiles_dir: str = 'profiles',
+                 cache_dir: Optional[Path] = None):
+        self.objects = GitObjects(repo)
+        self.target_app = target_app
+        self.profile_app = target_app.app_name
+        self.formats_dir = formats_dir
+        self.patterns_dir = patterns_dir
+        self.profiles_dir = profiles_dir
+        self.cache_dir = cache_dir
+        self._parsed: Dict[str, Dict] = {}
+        self._compiled: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, sha: str) -> Dict:
+        if sha not in self._parsed:
+            self._parsed[sha] = yaml.safe_load(self.objects.read_blob(sha))
+        return self._parsed[sha]
+
+    def _cached(self, key: str, compile_entry) -> Dict:
+        if key in self._compiled:
+            self.hits += 1
+            return self._compiled[key]
+
+        cache_path = self.cache_dir / f"{key}.json" if self.cache_dir else None
+        if cache_path and cache_path.exists():
+            with cache_path.open('r') as f:
+                compiled = json.load(f)
+            self.hits += 1
+        else:
+            compiled = compile_entry()
+            self.misses += 1
+            if cache_path:
+                with cache_path.open('w') as f:
+                    json.dump(compiled, f)
+
+        self._compiled[key] = compiled
+        return compiled
+
+    @staticmethod
+    def _key(*parts: str) -> str:
+        return hashlib.sha256('\0'.join(
+            (COMPILER_DIGEST, ) + parts).encode()).hexdigest()
+
+    def compile_revision(self, rev: str) -> CompiledCorpus:
+        commit = self.objects.resolve(rev)
+        corpus = CompiledCorpus()
+
+        patterns = {}
+        for _, sha in self.objects.list_blobs(commit, self.patterns_dir):
+            data = self._load(sha)
+            patterns[data['name']] = data['pattern']
+        converter = FormatConverter(patterns)
+
+        for path, sha in self.objects.list_blobs(commit, self.formats_dir):
+            data = self._load(sha)
+            # A format's output only depends on its own blob and the
+            # patterns it references
+            referenced = sorted({
+                condition['pattern']
+                for condition in data.get('conditions') or []
+                if 'pattern' in condition
+            })
+            key = self._key(
+                'format', sha, self.target_app.name,
+                json.dumps([(name, patterns.get(name))
+                            for name in referenced]))
+
+            def compile_format(data=data):
+                return format_output(
+                    converter.convert_format(CustomFormat(**data),
+                                             self.target_app))
+
+            corpus.formats[PurePosixPath(path).stem] = self._cached(
+                key, compile_format)
+
+        profile_converter = ProfileConverter(self.profile_app)
+        for _, sha in self.objects.list_blobs(commit, self.profiles_dir):
+            data = self._load(sha)
+            key = self._key('profile', sha, self.profile_app)
+            profile = self._cached(
+                key, lambda data=data: profile_converter.convert_profile(data))
+            corpus.profiles[profile['name']] = profile
+
+        return corpus
+
+    def close(self) -> None:
+        self.objects.close()
+
+
+def _identity(item) -> Optional[str]:
+    """Name identifying a list entry, e.g. a specification or quality item"""
+    if not isinstance(item, dict):
+        return None
+    if 'name' in item:
+        return item['name']
+    if isinstance(item.get('quality'), dict):
+        return item['quality'].get('name')
+    return None
+
+
+def _diff_values(old, new, path: str, changes: List[str]) -> None:
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in list(old) + [k for k in new if k not in old]:
+            child = f"{path}.{key}" if path else str(key)
+            if key not in new:
+                changes.append(f"- {child}: {json.dumps(old[key])}")
+            elif key not in old:
+                changes.append(f"+ {child}: {json.dumps(new[key])}")
+            else:
+                _diff_values(old[key], new[key], child, changes)
+    elif isinstance(old, list) and isinstance(new, list):
+        old_ids = [_identity(item) for item in old]
+        new_ids = [_identity(item) for item in new]
+        keyed = (None not in old_ids + new_ids
+                 and len(set(old_ids)) == len(old_ids)
+                 and len(set(new_ids)) == len(new_ids))
+        if keyed:
+            # Specifications, quality items and formatItems diff by name;
+            # a pure reordering is reported on its own
+            _diff_values(dict(zip(old_ids, old)), dict(zip(new_ids, new)),
+                         path, changes)
+            common = [name for name in old_ids if name in new_ids]
+            if common != [name for name in new_ids if name in old_ids]:
+                changes.append(f"~ {path}: order changed")
+        elif old != new:
+            changes.append(f"~ {path}: {json.dumps(old)} -> "
+                           f"{json.dumps(new)}")
+    elif old != new:
+        changes.append(f"~ {path}: {json.dumps(old)} -> {json.dumps(new)}")
+
+
+def diff_corpora(old: CompiledCorpus,
+                 new: CompiledCorpus) -> Dict[str, Dict[str, List[str]]]:
+    """Structural diff of compiled output, keyed by section and entry name"""
+    result = {}
+    for section in ('formats', 'profiles'):
+        old_entries = getattr(old, section)
+        new_entries = getattr(new, section)
+        entries = {}
+        for name in sorted(set(old_entries) | set(new_entries)):
+            if name not in new_entries:
+                entries[name] = ['- removed']
+            elif name not in old_entries:
+                entries[name] = ['+ added']
+            elif old_entries[name] != new_entries[name]:
+                changes = []
+                _diff_values(old_entries[name], new_entries[name], '',
+                             changes)
+                entries[name] = changes
+        result[section] = entries
+    return result
+
+
+def print_diff(diff: Dict[str, Dict[str, List[str]]]) -> None:
+    for section, entries in diff.items():
+        print(f"\n{section.title()}: {len(entries)} changed")
+        for name, changes in entries.items():
+            print(f"  {name}")
+            for change in changes:
+                print(f"    {change}")
+
+
+def write_corpus(corpus: CompiledCorpus, output_dir: Path,
+                 target_app: TargetApp) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    app = target_app.name.lower()
+
+    formats_path = output_dir / f"{app}_custom_formats.json"
+    with formats_path.open('w') as f:
+        json.dump(list(corpus.formats.values()), f, indent=2)
+    print(f"Output generated: {formats_path}")
+
+    profiles_path = output_dir / f"{app}_profiles.json"
+    with profiles_path.open('w') as f:
+        json.dump(list(corpus.profiles.values()), f, indent=2)
+    print(f"Output generated: {profiles_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compile formats and profiles straight from git revisions, optionally diffing two'
+    )
+    parser.add_argument('revisions',
+                        nargs='+',
+                        help='One revision to compile, or two to diff')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-r',
+                       '--radarr',
+                       action='store_true',
+                       help='Convert for Radarr')
+    group.add_argument('-s',
+                       '--sonarr',
+                       action='store_true',
+                       help='Convert for Sonarr')
+    parser.add_argument('--repo',
+                        type=Path,
+                        default=Path('.'),
+                        help='Path to the git repository (default: .)')
+    parser.add_argument(
+        '--formats-dir',
+        default='custom_formats',
+        help='Custom format directory in the tree (default: custom_formats)')
+    parser.add_argument(
+        '--patterns-dir',
+        default='regex_patterns',
+        help='Regex pattern directory in the tree (default: regex_patterns)')
+    parser.add_argument(
+        '--profiles-dir',
+        default='profiles',
+        help='Profile directory in the tree (default: profiles)')
+    parser.add_argument(
+        '--cache-dir',
+        type=Path,
+        help='Persist compiled results by blob SHA in this directory')
+    parser.add_argument('--output-dir',
+                        type=Path,
+                        default=Path('output'),
+                        help='Directory for output files (default: output)')
+    parser.add_argument('--json',
+                        action='store_true',
+                        help='Print the diff as JSON')
+    args = parser.parse_args()
+
+    if len(args.revisions) > 2:
+        parser.error('expected one or two revisions')
+
+    target_app = TargetApp.RADARR if args.radarr else TargetApp.SONARR
+    if args.cache_dir:
+        args.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    compiler = GitCompiler(args.repo, target_app, args.formats_dir,
+                           args.patterns_dir, args.profiles_dir,
+                           args.cache_dir)
+    try:
+        corpora = [compiler.compile_revision(rev) for rev in args.revisions]
+    except subprocess.CalledProcessError as error:
+        print(f"Error: git failed: {error.stderr.strip()}")
+        sys.exit(1)
+    finally:
+        compiler.close()
+
+    if len(corpora) == 1:
+        write_corpus(corpora[0], args.output_dir, target_app)
+    else:
+        diff = diff_corpora(*corpora)
+        if args.json:
+            print(json.dumps(diff, indent=2))
+        else:
+            print_diff(diff)
+
+    if not args.json:
+        print(f"\nCompiled entries reused: {compiler.hits}, "
+              f"compiled: {compiler.misses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import combinations, islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import argparse
+import csv
+import json
+import os
+import re
+import yaml
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from format_compile import (CustomFormat, FormatConverter, FormatProcessor,
+                            TargetApp)
+from regex_optimize import factor_alternations
+
+TITLE_SPECIFICATION = 'ReleaseTitleSpecification'
+# Radarr/Sonarr match release title patterns with RegexOptions.IgnoreCase
+TITLE_FLAGS = re.IGNORECASE
+MIN_ANCHOR_LENGTH = 2
+
+
+def _best(candidates: List[Set[str]]) -> Optional[Set[str]]:
+    """Pick the most selective requirement: longest shortest anchor"""
+    candidates = [c for c in candidates if c]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (min(map(len, c)), -len(c)))
+
+
+def _leading_literals(parsed) -> str:
+    chars = []
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            chars.append(chr(value).lower())
+        elif op is not sre_constants.AT:
+            break
+    return ''.join(chars)
+
+
+def _required_literals(parsed) -> Optional[Set[str]]:
+    """Literal strings of which every match must contain at least one.
+
+    Conservative: returns None when no useful requirement can be proven,
+    in which case the pattern is always verified with the real regex.
+    """
+    candidates = []
+    run = []
+
+    def close_run():
+        if run:
+            candidates.append({''.join(run)})
+            run.clear()
+
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            run.append(chr(value).lower())
+            continue
+        if op is sre_constants.AT:
+            # Zero-width anchors like \b don't split the literal text
+            continue
+        if op is sre_constants.BRANCH and run:
+            # The parser hoists common prefixes out of alternations, so
+            # glue the prefix back onto each alternative's leading literals
+            candidates.append({
+                ''.join(run) + _leading_literals(alt)
+                for alt in value[1]
+            })
+        close_run()
+        if op is sre_constants.SUBPATTERN:
+            candidates.append(_required_literals(value[-1]))
+        elif op is sre_constants.BRANCH:
+            alternatives = [_required_literals(alt) for alt in value[1]]
+            if all(alternatives):
+                candidates.append(set().union(*alternatives))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            minimum, _, body = value
+            if minimum >= 1:
+                candidates.append(_required_literals(body))
+    close_run()
+    return _best(candidates)
+
+
+def pattern_anchors(pattern: str) -> Optional[Set[str]]:
+    try:
+        anchors = _required_literals(sre_parse.parse(pattern))
+    except (re.error, RecursionError):
+        return None
+    if not anchors or min(map(len, anchors)) < MIN_ANCHOR_LENGTH:
+        return None
+    return anchors
+
+
+@dataclass
+class TitleFormat:
+    name: str
+    # (pattern index, negate, required) per release title specification
+    specs: List[Tuple[int, bool, bool]] = field(default_factory=list)
+
+
+@dataclass
+class OverlapModel:
+    """Compiled release title formats and the patterns they share"""
+    formats: List[TitleFormat]
+    patterns: List[str]
+    skipped: List[str]
+
+
+def build_model(formats_dir: Path,
+                patterns_dir: Path,
+                target_app: TargetApp,
+                include_partial: bool = False) -> OverlapModel:
+    converter = FormatConverter(FormatProcessor._load_patterns(patterns_dir))
+    pattern_index: Dict[str, int] = {}
+    formats = []
+    skipped = []
+
+    for format_path in sorted(formats_dir.glob('*.yml')):
+        with format_path.open('r') as f:
+            custom_format = CustomFormat(**yaml.safe_load(f))
+        converted = converter.convert_format(custom_format, target_app)
+        title_specs = [
+            spec for spec in converted.specifications
+            if spec.implementation == TITLE_SPECIFICATION
+        ]
+        if not title_specs:
+            continue
+        if len(title_specs) != len(converted.specifications) and (
+                not include_partial):
+            skipped.append(f"{converted.name} (non-title conditions)")
+            continue
+
+        try:
+            for spec in title_specs:
+                re.compile(spec.fields[0]['value'], TITLE_FLAGS)
+        except re.error:
+            skipped.append(f"{converted.name} (pattern is not Python regex)")
+            continue
+
+        title_format = TitleFormat(converted.name)
+        for spec in title_specs:
+            index = pattern_index.setdefault(spec.fields[0]['value'],
+                                             len(pattern_index))
+            title_format.specs.append((index, spec.negate, spec.required))
+        formats.append(title_format)
+
+    return OverlapModel(formats, list(pattern_index), skipped)
+
+
+class OverlapMatcher:
+    """Finds the formats matching a title in one scan for all patterns.
+
+    Required literals of every pattern are combined into a single
+    prefix-factored lookahead regex. At each position it captures the
+    longest anchor, and every anchor that is a prefix of it matches there
+    too, so one finditer pass yields all anchors present in the title. Only
+    patterns whose anchors were seen (or that have none) run their real
+    regex.
+    """
+
+    def __init__(self, model: OverlapModel):
+        self.formats = model.formats
+        self.regexes = [re.compile(p, TITLE_FLAGS) for p in model.patterns]
+        self.always: List[int] = []
+        anchored: Dict[str, Set[int]] = {}
+
+        for index, pattern in enumerate(model.patterns):
+            anchors = pattern_anchors(pattern)
+            if anchors is None:
+                self.always.append(index)
+                continue
+            for anchor in anchors:
+                anchored.setdefault(anchor, set()).add(index)
+
+        self.pattern_formats: List[List[int]] = [[] for _ in self.regexes]
+        self.negated_formats: List[int] = []
+        for index, title_format in enumerate(self.formats):
+            for pattern, negate, _ in title_format.specs:
+                self.pattern_formats[pattern].append(index)
+            if any(negate for _, negate, _ in title_format.specs):
+                self.negated_formats.append(index)
+
+        self.hits: Dict[str, Set[int]] = {}
+        for anchor in anchored:
+            self.hits[anchor] = set().union(*(anchored[anchor[:length]]
+                                              for length in range(
+                                                  1,
+                                                  len(anchor) + 1)
+                                              if anchor[:length] in anchored))
+
+        self.scanner = None
+        if anchored:
+            alternation = '|'.join(
+                re.escape(anchor) for anchor in sorted(anchored))
+            self.scanner = re.compile(
+                f"(?=({factor_alternations(alternation, 1)}))", re.DOTALL)
+
+    def matched_patterns(self, title: str) -> Set[int]:
+        candidates = set(self.always)
+        if self.scanner:
+            for match in self.scanner.finditer(title.lower()):
+                candidates |= self.hits[match.group(1)]
+        return {i for i in candidates if self.regexes[i].search(title)}
+
+    def matched_formats(self, title: str) -> List[int]:
+        matched = self.matched_patterns(title)
+        # Only formats touching a matched pattern, or with a negated
+        # condition that an absent pattern satisfies, can match
+        candidates = set(self.negated_formats)
+        for pattern in matched:
+            candidates.update(self.pattern_formats[pattern])
+
+        result = []
+        for index in sorted(candidates):
+            specs = self.formats[index].specs
+            satisfied = [(pattern in matched) != negate
+                         for pattern, negate, _ in specs]
+            required_ok = all(ok for ok, (_, _, required) in zip(
+                satisfied, specs) if required)
+            if required_ok and any(satisfied):
+                result.append(index)
+        return result
+
+
+_matcher: Optional[OverlapMatcher] = None
+
+
+def _init_worker(model: OverlapModel) -> None:
+    global _matcher
+    _matcher = OverlapMatcher(model)
+
+
+def _scan_chunk(args: Tuple[List[str], int]):
+    titles, max_examples = args
+    singles = Counter()
+    pairs = Counter()
+    examples: Dict[Tuple[int, int], List[str]] = {}
+    for title in titles:
+        matched = _matcher.matched_formats(title)
+        singles.update(matched)
+        for pair in combinations(matched, 2):
+            pairs[pair] += 1
+            pair_examples = examples.setdefault(pair, [])
+            if len(pair_examples) < max_examples:
+                pair_examples.append(title)
+    return len(titles), singles, pairs, examples
+
+
+def _chunks(corpus_path: Path, size: int) -> Iterator[List[str]]:
+    with corpus_path.open('r', encoding='utf-8') as f:
+        titles = (line.rstrip('\n') for line in f if line.strip())
+        while True:
+            chunk = list(islice(titles, size))
+            if not chunk:
+                return
+            yield chunk
+
+
+@dataclass
+class OverlapReport:
+    formats: List[str]
+    titles: int = 0
+    singles: Counter = field(default_factory=Counter)
+    pairs: Counter = field(default_factory=Counter)
+    examples: Dict[Tuple[int, int], List[str]] = field(default_factory=dict)
+
+    def to_json(self) -> Dict:
+        return {
+            'titles':
+            self.titles,
+            'formats': {
+                name: self.singles[index]
+                for index, name in enumerate(self.formats)
+            },
+            'pairs': [{
+                'formats': [self.formats[a], self.formats[b]],
+                'count': count,
+                'examples': self.examples.get((a, b), [])
+            } for (a, b), count in self.pairs.most_common()]
+        }
+
+    def write_matrix(self, csv_path: Path) -> None:
+        with csv_path.open('w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([''] + self.formats)
+            for a, name in enumerate(self.formats):
+                row = [name]
+                for b in range(len(self.formats)):
+                    if a == b:
+                        row.append(self.singles[a])
+                    else:
+                        row.append(self.pairs[(min(a, b), max(a, b))])
+                writer.writerow(row)
+
+
+def analyze(model: OverlapModel,
+            corpus_path: Path,
+            jobs: int = 1,
+            chunk_size: int = 10000,
+            max_examples: int = 3) -> OverlapReport:
+    report = OverlapReport([f.name for f in model.formats])
+    tasks = ((chunk, max_examples)
+             for chunk in _chunks(corpus_path, chunk_size))
+
+    if jobs == 1:
+        _init_worker(model)
+        results = map(_scan_chunk, tasks)
+        pool = None
+    else:
+        pool = Pool(jobs, initializer=_init_worker, initargs=(model, ))
+        results = pool.imap_unordered(_scan_chunk, tasks)
+
+    try:
+        for titles, singles, pairs, examples in results:
+            report.titles += titles
+            report.singles.update(singles)
+            report.pairs.update(pairs)
+            for pair, pair_examples in examples.items():
+                merged = report.examples.setdefault(pair, [])
+                merged.extend(pair_examples[:max_examples - len(merged)])
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Find release titles matched by several custom formats at once')
+    parser.add_argument('corpus',
+                        type=Path,
+                        help='File with one release title per line')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-r',
+                       '--radarr',
+                       action='store_true',
+                       help='Compile formats for Radarr')
+    group.add_argument('-s',
+                       '--sonarr',
+                       action='store_true',
+                       help='Compile formats for Sonarr')
+    parser.add_argument(
+        '--formats-dir',
+        type=Path,
+        default=Path('custom_formats'),
+        help=
+        'Directory containing custom format files (default: custom_formats)')
+    parser.add_argument(
+        '--patterns-dir',
+        type=Path,
+        default=Path('regex_patterns'),
+        help=
+        'Directory containing regex pattern files (default: regex_patterns)')
+    parser.add_argument(
+        '--include-partial',
+        action='store_true',
+        help='Also include formats with non-title conditions, '
+        'judged on their release title conditions only')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--examples',
+                        type=int,
+                        default=3,
+                        help='Example titles kept per pair (default: 3)')
+    parser.add_argument('--top',
+                        type=int,
+                        default=20,
+                        help='Pairs to print (default: 20)')
+    parser.add_argument('--output',
+                        type=Path,
+                        help='Write counts, pairs and examples as JSON')
+    parser.add_argument('--matrix-csv',
+                        type=Path,
+                        help='Write the format x format co-match matrix')
+    args = parser.parse_args()
+
+    target_app = TargetApp.RADARR if args.radarr else TargetApp.SONARR
+    model = build_model(args.formats_dir, args.patterns_dir, target_app,
+                        args.include_partial)
+    for reason in model.skipped:
+        print(f"Skipped: {reason}")
+
+    report = analyze(model,
+                     args.corpus,
+                     jobs=max(1, args.jobs),
+                     max_examples=args.examples)
+
+    print(f"\nScanned {report.titles} title(s) against "
+          f"{len(model.formats)} format(s)")
+    for (a, b), count in report.pairs.most_common(args.top):
+        print(f"  {count:>8}  {report.formats[a]} + {report.formats[b]}")
+        for example in report.examples.get((a, b), []):
+            print(f"            e.g. {example}")
+
+    if args.output:
+        with args.output.open('w') as f:
+            json.dump(report.to_json(), f, indent=2)
+        print(f"\nReport saved to: {args.output}")
+    if args.matrix_csv:
+        report.write_matrix(args.matrix_csv)
+        print(f"Matrix saved to: {args.matrix_csv}")
+
+
+if __name__ == '__main__':
+    main()
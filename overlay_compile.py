@@ -0,0 +1,381 @@
+from collections import ChainMap
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Set
+import argparse
+import hashlib
+import json
+import yaml
+
+from format_compile import (COMPILER_DIGEST, CompiledCorpus, CustomFormat,
+                            FormatConverter, FormatProcessor, TargetApp,
+                            format_output)
+from profile_compile import ProfileConverter
+
+CACHE_DIR = '.overlay_cache'
+
+# Profilarr profile keys an overlay may set, and their compiled names
+PROFILE_OVERRIDES = {
+    'upgradesAllowed': 'upgradeAllowed',
+    'minCustomFormatScore': 'minFormatScore',
+    'upgradeUntilScore': 'cutoffFormatScore',
+    'minScoreIncrement': 'minUpgradeFormatScore',
+}
+
+
+def _digest(paths: Iterable[Path], *extra: str) -> str:
+    sha = hashlib.sha256(COMPILER_DIGEST.encode())
+    for value in extra:
+        sha.update(value.encode())
+    for path in sorted(paths):
+        sha.update(str(path).encode())
+        sha.update(path.read_bytes())
+    return sha.hexdigest()
+
+
+def _yaml_files(directory: Optional[Path]) -> List[Path]:
+    if directory is None or not directory.exists():
+        return []
+    return sorted(directory.glob('*.yml'))
+
+
+def _referenced_patterns(format_data: Dict) -> Set[str]:
+    return {
+        condition['pattern']
+        for condition in format_data.get('conditions') or []
+        if 'pattern' in condition
+    }
+
+
+@dataclass
+class Overlay:
+    """Per-instance differences from the base corpus"""
+    name: str
+    path: Path
+    formats_dir: Optional[Path] = None
+    patterns_dir: Optional[Path] = None
+    profiles_dir: Optional[Path] = None
+    exclude_formats: List[str] = field(default_factory=list)
+    include_profiles: Optional[List[str]] = None
+    profiles: Dict[str, Dict] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, overlay_path: Path) -> 'Overlay':
+        with overlay_path.open('r') as f:
+            data = yaml.safe_load(f) or {}
+
+        def relative(key: str) -> Optional[Path]:
+            return overlay_path.parent / data[key] if key in data else None
+
+        return cls(name=data.get('name', overlay_path.stem),
+                   path=overlay_path,
+                   formats_dir=relative('formats_dir'),
+                   patterns_dir=relative('patterns_dir'),
+                   profiles_dir=relative('profiles_dir'),
+                   exclude_formats=data.get('exclude_formats', []),
+                   include_profiles=data.get('include_profiles'),
+                   profiles=data.get('profiles', {}))
+
+    def input_files(self) -> List[Path]:
+        return ([self.path] + _yaml_files(self.formats_dir) +
+                _yaml_files(self.patterns_dir) +
+                _yaml_files(self.profiles_dir))
+
+
+class OverlayCompiler:
+    """Compiles the shared base corpus once and derives each instance from
+    it with copy-on-write patches, so only overlay deltas are compiled per
+    instance. Compiled results are cached on disk keyed by input digests."""
+
+    def __init__(self, formats_dir: Path, patterns_dir: Path,
+                 profiles_dir: Path, output_dir: Path, target_app: TargetApp):
+        self.formats_dir = formats_dir
+        self.patterns_dir = patterns_dir
+        self.profiles_dir = profiles_dir
+        self.output_dir = output_dir
+        self.target_app = target_app
+        self.profile_app = target_app.app_name
+        self.cache_dir = output_dir / CACHE_DIR
+        self._base: Optional[CompiledCorpus] = None
+        self._base_digest: Optional[str] = None
+        self._base_patterns: Optional[Dict[str, str]] = None
+        self._base_references: Optional[Dict[Path, Set[str]]] = None
+
+    def _cache_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load_cached(self, digest: str) -> Optional[CompiledCorpus]:
+        cache_path = self._cache_path(digest)
+        if not cache_path.exists():
+            return None
+        with cache_path.open('r') as f:
+            return CompiledCorpus(**json.load(f))
+
+    def _store_cached(self, digest: str, corpus: CompiledCorpus) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with self._cache_path(digest).open('w') as f:
+            json.dump(vars(corpus), f)
+
+    @property
+    def base_patterns(self) -> Dict[str, str]:
+        if self._base_patterns is None:
+            self._base_patterns = FormatProcessor._load_patterns(
+                self.patterns_dir)
+        return self._base_patterns
+
+    @property
+    def base_references(self) -> Dict[Path, Set[str]]:
+        """Pattern names referenced by each base format file"""
+        if self._base_references is None:
+            self._base_references = {}
+            for format_path in _yaml_files(self.formats_dir):
+                with format_path.open('r') as f:
+                    self._base_references[format_path] = (
+                        _referenced_patterns(yaml.safe_load(f)))
+        return self._base_references
+
+    def _compile(self, format_paths: List[Path], profile_paths: List[Path],
+                 patterns: Mapping[str, str]) -> CompiledCorpus:
+        corpus = CompiledCorpus()
+        converter = FormatConverter(patterns)
+        for format_path in format_paths:
+            with format_path.open('r') as f:
+                custom_format = CustomFormat(**yaml.safe_load(f))
+            corpus.formats[format_path.stem] = format_output(
+                converter.convert_format(custom_format, self.target_app))
+
+        profile_converter = ProfileConverter(self.profile_app)
+        for profile_path in profile_paths:
+            with profile_path.open('r') as f:
+                profile = profile_converter.convert_profile(
+                    yaml.safe_load(f))
+            corpus.profiles[profile['name']] = profile
+        return corpus
+
+    @property
+    def base_digest(self) -> str:
+        if self._base_digest is None:
+            self._base_digest = _digest(
+                _yaml_files(self.formats_dir) +
+                _yaml_files(self.patterns_dir) +
+                _yaml_files(self.profiles_dir), 'base', self.target_app.name)
+        return self._base_digest
+
+    @property
+    def base(self) -> CompiledCorpus:
+        if self._base is None:
+            self._base = self._load_cached(self.base_digest)
+            if self._base is None:
+                print("Compiling base corpus...")
+                self._base = self._compile(_yaml_files(self.formats_dir),
+                                           _yaml_files(self.profiles_dir),
+                                           self.base_patterns)
+                self._store_cached(self.base_digest, self._base)
+            else:
+                print("Using cached base corpus")
+        return self._base
+
+    def _compile_delta(self, overlay: Overlay) -> CompiledCorpus:
+        """Compile the formats and profiles the overlay adds, plus the base
+        formats whose patterns the overlay overrides"""
+        if not (overlay.formats_dir or overlay.patterns_dir
+                or overlay.profiles_dir):
+            return CompiledCorpus()
+
+        digest = _digest(
+            _yaml_files(overlay.formats_dir) +
+            _yaml_files(overlay.patterns_dir) +
+            _yaml_files(overlay.profiles_dir), 'delta', overlay.name,
+            self.base_digest)
+        delta = self._load_cached(digest)
+        if delta is None:
+            format_paths = _yaml_files(overlay.formats_dir)
+            patterns = self.base_patterns
+            if overlay.patterns_dir:
+                overrides = FormatProcessor._load_patterns(
+                    overlay.patterns_dir)
+                patterns = ChainMap(overrides, patterns)
+                # Base formats using an overridden pattern must be compiled
+                # against the instance's value instead of the base one
+                own = {path.stem for path in format_paths}
+                format_paths += [
+                    path for path, names in self.base_references.items()
+                    if path.stem not in own and names & set(overrides)
+                ]
+            delta = self._compile(format_paths,
+                                  _yaml_files(overlay.profiles_dir), patterns)
+            self._store_cached(digest, delta)
+        return delta
+
+    @staticmethod
+    def _patch_profile(profile: Dict, patch: Dict,
+                       excluded: Iterable[str]) -> Dict:
+        """Return a patched copy; unchanged nested data is shared"""
+        patched = dict(profile)
+        for key, compiled_key in PROFILE_OVERRIDES.items():
+            if key in patch:
+                patched[compiled_key] = patch[key]
+        if 'minScoreIncrement' in patch:
+            patched['minUpgradeFormatScore'] = max(1,
+                                                   patch['minScoreIncrement'])
+
+        scores = patch.get('custom_formats', {})
+        excluded = set(excluded)
+        if not scores and not excluded.intersection(
+                item['name'] for item in profile['formatItems']):
+            return patched
+
+        format_items = []
+        for item in profile['formatItems']:
+            name = item['name']
+            if name in excluded or (name in scores and scores[name] is None):
+                continue
+            score = scores.get(name, item['score'])
+            if score == item['score'] and item['format'] == len(
+                    format_items) + 1:
+                format_items.append(item)
+            else:
+                format_items.append({
+                    'format': len(format_items) + 1,
+                    'name': name,
+                    'score': score
+                })
+
+        existing = {item['name'] for item in profile['formatItems']}
+        for name, score in scores.items():
+            if name not in existing and score is not None:
+                format_items.append({
+                    'format': len(format_items) + 1,
+                    'name': name,
+                    'score': score
+                })
+        patched['formatItems'] = format_items
+        return patched
+
+    def compile_instance(self, overlay: Overlay) -> CompiledCorpus:
+        base = self.base
+        delta = self._compile_delta(overlay)
+
+        formats = ChainMap(delta.formats, base.formats)
+        # Excludes use declared format names, as profile formatItems do,
+        # while compiled formats are keyed by file stem
+        excluded = set(overlay.exclude_formats)
+        instance = CompiledCorpus(formats={
+            stem: compiled
+            for stem, compiled in formats.items()
+            if compiled['name'] not in excluded
+        })
+        declared = {compiled['name'] for compiled in formats.values()}
+        for name in overlay.exclude_formats:
+            if name not in declared:
+                print(f"Warning: {overlay.name}: excluded format not "
+                      f"found: {name}")
+
+        profiles = ChainMap(delta.profiles, base.profiles)
+        names = (overlay.include_profiles
+                 if overlay.include_profiles is not None else list(profiles))
+        for name in names:
+            if name not in profiles:
+                print(f"Warning: {overlay.name}: profile not found: {name}")
+                continue
+            patch = overlay.profiles.get(name, {})
+            if patch or excluded:
+                instance.profiles[name] = self._patch_profile(
+                    profiles[name], patch, excluded)
+            else:
+                instance.profiles[name] = profiles[name]
+
+        for name in overlay.profiles:
+            if name not in profiles:
+                print(f"Warning: {overlay.name}: overlay patches unknown "
+                      f"profile: {name}")
+        return instance
+
+    def write_instance(self, overlay: Overlay) -> bool:
+        """Write an instance's output, skipping it when nothing changed"""
+        instance_dir = self.output_dir / overlay.name
+        manifest_path = instance_dir / 'manifest.json'
+        digest = _digest(overlay.input_files(), self.base_digest)
+
+        if manifest_path.exists():
+            with manifest_path.open('r') as f:
+                if json.load(f).get('digest') == digest:
+                    print(f"Up to date: {overlay.name}")
+                    return False
+
+        instance = self.compile_instance(overlay)
+        instance_dir.mkdir(parents=True, exist_ok=True)
+        app = self.target_app.name.lower()
+
+        formats_path = instance_dir / f"{app}_custom_formats.json"
+        with formats_path.open('w') as f:
+            json.dump(list(instance.formats.values()), f, indent=2)
+
+        profiles_path = instance_dir / f"{app}_profiles.json"
+        with profiles_path.open('w') as f:
+            json.dump(list(instance.profiles.values()), f, indent=2)
+
+        with manifest_path.open('w') as f:
+            json.dump({'digest': digest}, f)
+
+        print(f"Output generated: {instance_dir} "
+              f"({len(instance.formats)} format(s), "
+              f"{len(instance.profiles)} profile(s))")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compile a shared base corpus once and apply per-instance overlays')
+    parser.add_argument('overlays',
+                        type=Path,
+                        nargs='+',
+                        help='Instance overlay YAML files')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-r',
+                       '--radarr',
+                       action='store_true',
+                       help='Convert for Radarr')
+    group.add_argument('-s',
+                       '--sonarr',
+                       action='store_true',
+                       help='Convert for Sonarr')
+    parser.add_argument(
+        '--formats-dir',
+        type=Path,
+        default=Path('custom_formats'),
+        help='Directory containing base custom format files '
+        '(default: custom_formats)')
+    parser.add_argument(
+        '--patterns-dir',
+        type=Path,
+        default=Path('regex_patterns'),
+        help=
+        'Directory containing base regex pattern files (default: regex_patterns)'
+    )
+    parser.add_argument(
+        '--profiles-dir',
+        type=Path,
+        default=Path('profiles'),
+        help='Directory containing base profile files (default: profiles)')
+    parser.add_argument('--output-dir',
+                        type=Path,
+                        default=Path('output'),
+                        help='Directory for output files (default: output)')
+    args = parser.parse_args()
+
+    target_app = TargetApp.RADARR if args.radarr else TargetApp.SONARR
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    compiler = OverlayCompiler(args.formats_dir, args.patterns_dir,
+                               args.profiles_dir, args.output_dir, target_app)
+    written = sum(
+        compiler.write_instance(Overlay.load(overlay_path))
+        for overlay_path in args.overlays)
+    print(f"\nProcessing complete!")
+    print(f"Instances written: {written}/{len(args.overlays)}")
+
+
+if __name__ == '__main__':
+    main()
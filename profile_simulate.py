@@ -0,0 +1,286 @@
+import argparse
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+NOT_ALLOWED = -1
+
+
+@dataclass
+class CandidateBatch:
+    """Columnar batch of releases, one row per candidate.
+
+    Quality and format names are dictionary-encoded: the per-row arrays hold
+    codes into ``quality_names``/``format_names``, so each profile only has
+    to resolve the distinct names once.
+    """
+    events: np.ndarray
+    qualities: np.ndarray
+    quality_names: np.ndarray
+    scores: Optional[np.ndarray] = None
+    current_qualities: Optional[np.ndarray] = None
+    current_scores: Optional[np.ndarray] = None
+    # Matched custom formats as (row, format code) pairs, used to score rows
+    # per profile when no fixed score column is given
+    format_names: Optional[np.ndarray] = None
+    format_rows: Optional[np.ndarray] = None
+    format_codes: Optional[np.ndarray] = None
+    current_format_rows: Optional[np.ndarray] = None
+    current_format_codes: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.qualities)
+
+
+class ProfileSimulator:
+    """Grab and upgrade decisions for one compiled quality profile.
+
+    The rank of a quality is the position of its item in the compiled
+    ``items`` list (later items are preferred), with every quality in a
+    group sharing the group's rank. Qualities that are not allowed rank -1.
+    """
+
+    def __init__(self, profile: Dict):
+        self.name = profile["name"]
+        self.upgrade_allowed = profile.get("upgradeAllowed", True)
+        self.min_format_score = profile.get("minFormatScore", 0)
+        self.cutoff_format_score = profile.get("cutoffFormatScore", 0)
+        self.min_upgrade_format_score = profile.get("minUpgradeFormatScore",
+                                                    1)
+        self.format_scores = {
+            item["name"]: item["score"]
+            for item in profile.get("formatItems", [])
+        }
+
+        self.quality_ids = {}
+        group_ranks = {}
+        quality_ranks = {}
+        for rank, item in enumerate(profile.get("items", [])):
+            members = item["items"] if item.get("items") else [item]
+            for member in members:
+                quality = member["quality"]
+                self.quality_ids[quality["name"]] = quality["id"]
+                if item.get("allowed") and member.get("allowed", True):
+                    quality_ranks[quality["id"]] = rank
+            if "id" in item:
+                group_ranks[item["id"]] = rank
+
+        size = max(self.quality_ids.values(), default=0) + 1
+        self.ranks = np.full(size, NOT_ALLOWED, dtype=np.int32)
+        for quality_id, rank in quality_ranks.items():
+            self.ranks[quality_id] = rank
+
+        cutoff = profile.get("cutoff")
+        if cutoff in group_ranks:
+            self.cutoff_rank = group_ranks[cutoff]
+        elif cutoff is not None and 0 <= cutoff < size:
+            self.cutoff_rank = int(self.ranks[cutoff])
+        else:
+            self.cutoff_rank = int(self.ranks.max(initial=NOT_ALLOWED))
+
+    @classmethod
+    def from_file(cls, profile_path: Path) -> List['ProfileSimulator']:
+        with profile_path.open('r') as f:
+            data = json.load(f)
+        profiles = data if isinstance(data, list) else [data]
+        return [cls(profile) for profile in profiles]
+
+    def lookup_quality_ids(self, names: Sequence[str]) -> np.ndarray:
+        """Map quality names to ids, -1 for names this app doesn't know"""
+        return np.array([self.quality_ids.get(name, -1) for name in names],
+                        dtype=np.int32)
+
+    def rank(self, qualities: np.ndarray) -> np.ndarray:
+        qualities = np.asarray(qualities)
+        valid = (qualities >= 0) & (qualities < len(self.ranks))
+        ranks = self.ranks[np.where(valid, qualities, 0)]
+        return np.where(valid, ranks, NOT_ALLOWED)
+
+    def score(self, rows: np.ndarray, codes: np.ndarray,
+              names: Sequence[str], size: int) -> np.ndarray:
+        """Sum this profile's format scores over (row, format code) pairs"""
+        weights = np.array([self.format_scores.get(name, 0) for name in names],
+                           dtype=np.int64)
+        return np.bincount(rows, weights=weights[codes],
+                           minlength=size).astype(np.int64)
+
+    def grab(self, qualities: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Whether each candidate is acceptable at all"""
+        return (self.rank(qualities) >= 0) & (np.asarray(scores) >=
+                                              self.min_format_score)
+
+    def cutoff_met(self, qualities: np.ndarray,
+                   scores: np.ndarray) -> np.ndarray:
+        return ((self.rank(qualities) >= self.cutoff_rank) &
+                (np.asarray(scores) >= self.cutoff_format_score))
+
+    def upgrade(self, qualities: np.ndarray, scores: np.ndarray,
+                current_qualities: np.ndarray,
+                current_scores: np.ndarray) -> np.ndarray:
+        """Whether each candidate would replace the current file.
+
+        A better quality always upgrades; at equal quality the custom format
+        score must improve by at least minUpgradeFormatScore. Nothing
+        upgrades once both the quality and score cutoffs are met.
+        """
+        if not self.upgrade_allowed:
+            return np.zeros(len(qualities), dtype=bool)
+
+        rank = self.rank(qualities)
+        current_rank = self.rank(current_qualities)
+        score_gain = np.asarray(scores) - np.asarray(current_scores)
+        better = (rank > current_rank) | (
+            (rank == current_rank) &
+            (score_gain >= max(1, self.min_upgrade_format_score)))
+        return (self.grab(qualities, scores) & better &
+                ~self.cutoff_met(current_qualities, current_scores))
+
+    def pick(self, events: np.ndarray, qualities: np.ndarray,
+             scores: np.ndarray) -> np.ndarray:
+        """Index of the release picked for each event, -1 when none qualify.
+
+        Candidates are ranked by quality first and custom format score
+        second, and events are expected to be numbered 0..N-1.
+        """
+        events = np.asarray(events)
+        eligible = np.flatnonzero(self.grab(qualities, scores))
+        order = np.lexsort((np.asarray(scores)[eligible],
+                            self.rank(qualities)[eligible], events[eligible]))
+        ordered = eligible[order]
+        ordered_events = events[ordered]
+        last = np.ones(len(ordered), dtype=bool)
+        last[:-1] = ordered_events[1:] != ordered_events[:-1]
+
+        size = int(events.max()) + 1 if len(events) else 0
+        picks = np.full(size, -1, dtype=np.int64)
+        picks[ordered_events[last]] = ordered[last]
+        return picks
+
+    def simulate(self, batch: CandidateBatch) -> Dict[str, int]:
+        quality_ids = self.lookup_quality_ids(batch.quality_names)
+        qualities = quality_ids[batch.qualities]
+        if batch.format_rows is not None:
+            scores = self.score(batch.format_rows, batch.format_codes,
+                                batch.format_names, len(batch))
+        else:
+            scores = batch.scores
+
+        picks = self.pick(batch.events, qualities, scores)
+        summary = {
+            "candidates": len(batch),
+            "grabbable": int(self.grab(qualities, scores).sum()),
+            "events": len(picks),
+            "picked": int((picks >= 0).sum()),
+        }
+
+        if batch.current_qualities is not None:
+            current_qualities = quality_ids[batch.current_qualities]
+            if batch.current_format_rows is not None:
+                current_scores = self.score(batch.current_format_rows,
+                                            batch.current_format_codes,
+                                            batch.format_names, len(batch))
+            else:
+                current_scores = batch.current_scores
+            summary["upgrades"] = int(
+                self.upgrade(qualities, scores, current_qualities,
+                             current_scores).sum())
+        return summary
+
+
+def _encode(values: List[str], vocabulary: Dict[str, int]) -> np.ndarray:
+    return np.array([vocabulary.setdefault(v, len(vocabulary)) for v in values],
+                    dtype=np.int64)
+
+
+def _split_formats(column: List[str], vocabulary: Dict[str, int]):
+    rows = []
+    codes = []
+    for row, value in enumerate(column):
+        for name in filter(None, value.split('|')):
+            rows.append(row)
+            codes.append(vocabulary.setdefault(name, len(vocabulary)))
+    return np.array(rows, dtype=np.int64), np.array(codes, dtype=np.int64)
+
+
+def load_history(history_path: Path) -> CandidateBatch:
+    """Read a CSV with event, quality and either score or formats columns
+    (formats separated by '|'), plus optional current_* columns"""
+    with history_path.open('r', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = {name: [] for name in reader.fieldnames}
+        for row in reader:
+            for name in reader.fieldnames:
+                columns[name].append(row[name])
+
+    qualities = {}
+    formats = {}
+    batch = CandidateBatch(events=_encode(columns['event'], {}),
+                           qualities=_encode(columns['quality'], qualities),
+                           quality_names=np.array([]))
+
+    if 'formats' in columns:
+        batch.format_rows, batch.format_codes = _split_formats(
+            columns['formats'], formats)
+    else:
+        batch.scores = np.array(columns['score'], dtype=np.int64)
+
+    if 'current_quality' in columns:
+        batch.current_qualities = _encode(columns['current_quality'],
+                                          qualities)
+        if 'current_formats' in columns:
+            batch.current_format_rows, batch.current_format_codes = (
+                _split_formats(columns['current_formats'], formats))
+        else:
+            batch.current_scores = np.array(columns['current_score'],
+                                            dtype=np.int64)
+
+    batch.quality_names = np.array(list(qualities), dtype=str)
+    batch.format_names = np.array(list(formats), dtype=str)
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Simulate grab and upgrade decisions of compiled profiles against release history'
+    )
+    parser.add_argument(
+        'history',
+        type=Path,
+        help=
+        'CSV of candidates with event, quality and score or formats columns')
+    parser.add_argument('profiles',
+                        type=Path,
+                        nargs='+',
+                        help='Compiled profile JSON files')
+    parser.add_argument('--output',
+                        type=Path,
+                        help='Write the per-profile summary as JSON')
+    args = parser.parse_args()
+
+    batch = load_history(args.history)
+    results = {}
+    for profile_path in args.profiles:
+        for simulator in ProfileSimulator.from_file(profile_path):
+            summary = simulator.simulate(batch)
+            results[simulator.name] = summary
+            line = (f"{simulator.name}: picked {summary['picked']}/"
+                    f"{summary['events']} event(s), "
+                    f"{summary['grabbable']}/{summary['candidates']} "
+                    f"candidate(s) grabbable")
+            if "upgrades" in summary:
+                line += f", {summary['upgrades']} upgrade(s)"
+            print(line)
+
+    if args.output:
+        with args.output.open('w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSummary saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
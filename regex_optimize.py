@@ -0,0 +1,504 @@
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import re
+import timeit
+
+# Group openers whose body can safely be rewritten in place
+REWRITABLE_OPENERS = ('(?<=', '(?<!', '(?:', '(?=', '(?!')
+FLAGS_PREFIX = re.compile(r'^\(\?[aiLmsux]+\)')
+QUANTIFIER = re.compile(r'(?:[*+?]|\{\d*(?:,\d*)?\})[?+]?')
+BACKREFERENCE = re.compile(r'\\(?:[1-9]|k<|g<)')
+OCTAL_ESCAPE = re.compile(r'0[0-7]{0,2}|[0-7]{3}')
+GROUP_REFERENCE = re.compile(r'[1-9][0-9]?')
+# Atoms that match a position rather than a character
+ZERO_WIDTH_ATOMS = ('^', '$', r'\b', r'\B', r'\A', r'\Z')
+LOOKAROUND_OPENERS = ('(?=', '(?!', '(?<=', '(?<!')
+MERGEABLE_IMPLEMENTATIONS = ('ReleaseTitleSpecification',
+                             'ReleaseGroupSpecification')
+
+
+class _TrieNode:
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.end = False
+
+
+def _scan_escape(pattern: str, pos: int) -> int:
+    """Return the index just past the escape sequence starting at pos"""
+    if pos + 1 >= len(pattern):
+        return len(pattern)
+    nxt = pattern[pos + 1]
+    if nxt == 'x':
+        return min(pos + 4, len(pattern))
+    if nxt == 'u':
+        return min(pos + 6, len(pattern))
+    if nxt == 'U':
+        return min(pos + 10, len(pattern))
+    if nxt.isdigit():
+        # Octal escapes (\0, \0nn, \nnn) and group references (\n, \nn)
+        # are single atoms; splitting them changes what they match
+        octal = OCTAL_ESCAPE.match(pattern, pos + 1)
+        if octal:
+            return octal.end()
+        return GROUP_REFERENCE.match(pattern, pos + 1).end()
+    if nxt in 'pPNk' and pos + 2 < len(pattern) and pattern[pos + 2] in '{<':
+        close = '}' if pattern[pos + 2] == '{' else '>'
+        end = pattern.find(close, pos + 3)
+        return len(pattern) if end == -1 else end + 1
+    return pos + 2
+
+
+def _scan_class(pattern: str, pos: int) -> int:
+    """Return the index just past the character class starting at pos"""
+    i = pos + 1
+    if i < len(pattern) and pattern[i] == '^':
+        i += 1
+    if i < len(pattern) and pattern[i] == ']':
+        i += 1
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i = _scan_escape(pattern, i)
+            continue
+        if pattern[i] == '[' and pattern.startswith('[:', i):
+            end = pattern.find(':]', i + 2)
+            i = len(pattern) if end == -1 else end + 2
+            continue
+        if pattern[i] == ']':
+            return i + 1
+        i += 1
+    raise ValueError(f"Unterminated character class at {pos}")
+
+
+def _scan_group(pattern: str, pos: int) -> int:
+    """Return the index just past the group starting at pos"""
+    depth = 0
+    i = pos
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i = _scan_escape(pattern, i)
+            continue
+        if char == '[':
+            i = _scan_class(pattern, i)
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise ValueError(f"Unbalanced parenthesis at {pos}")
+
+
+def _group_opener(group: str) -> str:
+    for opener in REWRITABLE_OPENERS:
+        if group.startswith(opener):
+            return opener
+    if group.startswith('(?'):
+        return ''
+    return '('
+
+
+def _tokenize(pattern: str) -> List[List[str]]:
+    """Split a pattern into top-level alternatives of quantified atoms"""
+    alternatives = [[]]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '|':
+            alternatives.append([])
+            i += 1
+            continue
+        if char == '\\':
+            end = _scan_escape(pattern, i)
+        elif char == '[':
+            end = _scan_class(pattern, i)
+        elif char == '(':
+            end = _scan_group(pattern, i)
+        elif char == ')':
+            raise ValueError(f"Unbalanced parenthesis at {i}")
+        else:
+            end = i + 1
+        quantifier = QUANTIFIER.match(pattern, end)
+        if quantifier:
+            end = quantifier.end()
+        alternatives[-1].append(pattern[i:end])
+        i = end
+    return alternatives
+
+
+def _split_quantifier(atom: str) -> Tuple[str, str]:
+    if atom.startswith('('):
+        base_end = _scan_group(atom, 0)
+    elif atom.startswith('['):
+        base_end = _scan_class(atom, 0)
+    elif atom.startswith('\\'):
+        base_end = _scan_escape(atom, 0)
+    else:
+        base_end = 1
+    return atom[:base_end], atom[base_end:]
+
+
+def _is_capturing(atom: str) -> bool:
+    return atom.startswith('(') and _group_opener(atom) == '('
+
+
+def _is_opaque(atom: str) -> bool:
+    """Groups we cannot see into, e.g. named groups or inline flags"""
+    return atom.startswith('(') and _group_opener(atom) == ''
+
+
+def _is_plain_atom(atom: str) -> bool:
+    """Single unquantified character that can be followed by '?' directly"""
+    if len(atom) == 1:
+        return atom not in '^$.'
+    return (atom.startswith('\\') and len(atom) == 2
+            and not atom[1].isalnum())
+
+
+def _is_class_member(atom: str) -> bool:
+    if len(atom) == 1:
+        return atom.isalnum()
+    return len(atom) == 2 and atom[0] == '\\' and not atom[1].isalnum()
+
+
+def _literal_char(atom: str) -> Optional[str]:
+    """The character a single literal atom matches, if it is one"""
+    if len(atom) == 1:
+        return None if atom in '.^$*+?{}[]\\|()' else atom
+    if len(atom) == 2 and atom[0] == '\\' and not atom[1].isalnum():
+        return atom[1]
+    return None
+
+
+def _is_zero_width(atom: str) -> bool:
+    return atom in ZERO_WIDTH_ATOMS or atom.startswith(LOOKAROUND_OPENERS)
+
+
+def _fold_case(atom: str) -> str:
+    return atom.lower() if len(atom) == 1 else atom
+
+
+def _emit(node: _TrieNode) -> str:
+    """Emit the language of suffixes below node"""
+    members = []
+    branches = []
+    for token, child in node.children.items():
+        if not child.children and _is_class_member(token):
+            members.append(token)
+        else:
+            branches.append(token + _emit(child))
+
+    if len(members) > 1:
+        branches.insert(0, '[' + ''.join(members) + ']')
+    elif members:
+        branches.insert(0, members[0])
+
+    if not branches:
+        return ''
+
+    if len(branches) == 1:
+        body = branches[0]
+        atomic = len(members) > 1 or _is_plain_atom(body)
+    else:
+        body = '(?:' + '|'.join(branches) + ')'
+        atomic = True
+
+    if node.end:
+        if not atomic:
+            body = '(?:' + body + ')'
+        body += '?'
+    return body
+
+
+def factor_alternations(pattern: str, min_alternatives: int = 3) -> str:
+    """Rewrite literal-ish alternations into a prefix-shared trie.
+
+    Capturing groups, backreference numbering and anchors are preserved;
+    alternations containing capturing, named or inline-flag groups are left
+    as they are.
+    """
+    flags_match = FLAGS_PREFIX.match(pattern)
+    flags = flags_match.group(0) if flags_match else ''
+    body = pattern[len(flags):]
+    return flags + _rewrite(body, min_alternatives, 'i' in flags)
+
+
+def _rewrite(pattern: str, min_alternatives: int, ignore_case: bool) -> str:
+    alternatives = []
+    for atoms in _tokenize(pattern):
+        rewritten = []
+        for atom in atoms:
+            if atom.startswith('(') and not _is_opaque(atom):
+                base, quantifier = _split_quantifier(atom)
+                opener = _group_opener(base)
+                inner = _rewrite(base[len(opener):-1], min_alternatives,
+                                 ignore_case)
+                atom = opener + inner + ')' + quantifier
+            rewritten.append(atom)
+        alternatives.append(rewritten)
+
+    factorable = len(alternatives) >= min_alternatives and not any(
+        _is_capturing(atom) or _is_opaque(atom) for atoms in alternatives
+        for atom in atoms)
+    if not factorable:
+        return '|'.join(''.join(atoms) for atoms in alternatives)
+
+    root = _TrieNode()
+    for atoms in alternatives:
+        node = root
+        for atom in atoms:
+            key = _fold_case(atom) if ignore_case else atom
+            node = node.children.setdefault(key, _TrieNode())
+        node.end = True
+
+    regex = _emit(root)
+    # Alternation binds loosest, so a group spanning the whole body is noise
+    if regex.startswith('(?:') and _scan_group(regex, 0) == len(regex):
+        regex = regex[3:-1]
+    return regex
+
+
+def literal_samples(pattern: str) -> List[str]:
+    """Build positive and near-miss inputs from the literal alternatives"""
+    flags_match = FLAGS_PREFIX.match(pattern)
+    body = pattern[flags_match.end():] if flags_match else pattern
+    samples = []
+    try:
+        alternatives = _tokenize(body)
+    except ValueError:
+        return samples
+
+    def walk(atoms: List[str]):
+        for atom in atoms:
+            if atom.startswith('(') and not _is_opaque(atom):
+                base, _ = _split_quantifier(atom)
+                opener = _group_opener(base)
+                try:
+                    for inner in _tokenize(base[len(opener):-1]):
+                        walk(inner)
+                except ValueError:
+                    pass
+        # Anchors like \b don't consume text, so they don't stop an
+        # alternative from being literal; optional characters yield both
+        # the shortest and the longest spelling
+        shortest, longest = [], []
+        for atom in atoms:
+            if _is_zero_width(atom):
+                continue
+            base, quantifier = _split_quantifier(atom)
+            char = _literal_char(base)
+            if char is None or quantifier not in ('', '?'):
+                return
+            longest.append(char)
+            if not quantifier:
+                shortest.append(char)
+
+        for literal in dict.fromkeys((''.join(shortest), ''.join(longest))):
+            if not literal:
+                continue
+            samples.extend([
+                literal, f"Movie.2020.{literal}.1080p",
+                f"Movie 2020 {literal}-GRP", literal[:-1], literal[1:]
+            ])
+
+    for atoms in alternatives:
+        walk(atoms)
+    return samples
+
+
+@dataclass
+class PatternRewrite:
+    format_name: str
+    spec_name: str
+    original_length: int
+    optimized_length: int
+    samples: int
+    # None when the check was not reached
+    equivalent: Optional[bool]
+    speedup: Optional[float]
+    status: str
+
+
+class PatternOptimizer:
+    """Rewrites emitted release_title/release_group patterns.
+
+    A rewrite is only kept when there are at least min_samples samples (the
+    format's tests, the sample corpus and inputs derived from the pattern's
+    own literals), the original and optimized patterns agree on every one of
+    them, and the optimized pattern is not measurably slower on them.
+    """
+
+    def __init__(self,
+                 corpus: Optional[Iterable[str]] = None,
+                 min_alternatives: int = 3,
+                 min_speedup: float = 1.0,
+                 merge_conditions: bool = True,
+                 min_samples: int = 100):
+        self.corpus = list(corpus or [])
+        self.min_alternatives = min_alternatives
+        self.min_speedup = min_speedup
+        self.min_samples = min_samples
+        self.merge_conditions = merge_conditions
+        self.report: List[PatternRewrite] = []
+
+    @staticmethod
+    def load_corpus(corpus_path: Path) -> List[str]:
+        with corpus_path.open('r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip()]
+
+    @staticmethod
+    def _test_inputs(tests: Optional[List[Dict]]) -> List[str]:
+        inputs = []
+        for test in tests or []:
+            if not isinstance(test, dict):
+                continue
+            value = test.get('input', test.get('title'))
+            if isinstance(value, str):
+                inputs.append(value)
+        return inputs
+
+    @staticmethod
+    def _time(regex: 're.Pattern', samples: List[str]) -> float:
+        search = regex.search
+        return min(
+            timeit.repeat(lambda: [search(s) for s in samples],
+                          number=5,
+                          repeat=3))
+
+    def _verify(
+            self, original: List[str], optimized: str, samples: List[str]
+    ) -> Tuple[str, Optional[bool], Optional[float]]:
+        """Return (status, equivalent, speedup)"""
+        try:
+            original_regexes = [re.compile(p) for p in original]
+            optimized_regex = re.compile(optimized)
+        except re.error:
+            return 'unverifiable', None, None
+
+        if len(samples) < self.min_samples:
+            return (f"too few samples, need {self.min_samples}", None, None)
+
+        for sample in samples:
+            expected = any(r.search(sample) for r in original_regexes)
+            if bool(optimized_regex.search(sample)) != expected:
+                return 'mismatch', False, None
+
+        before = sum(self._time(r, samples) for r in original_regexes)
+        after = self._time(optimized_regex, samples)
+        speedup = before / after if after else 0.0
+        if speedup < self.min_speedup:
+            return 'slower', True, speedup
+        return 'rewritten', True, speedup
+
+    def _rewrite_spec(self, format_name: str, specs: List,
+                      tests: List[str]):
+        """Try to replace specs with a single optimized spec"""
+        patterns = [spec.fields[0]['value'] for spec in specs]
+        name = ' | '.join(spec.name for spec in specs if spec.name)
+
+        try:
+            if len(specs) > 1:
+                flags = {
+                    FLAGS_PREFIX.match(p).group(0)
+                    if FLAGS_PREFIX.match(p) else ''
+                    for p in patterns
+                }
+                if len(flags) != 1 or any(
+                        BACKREFERENCE.search(p) for p in patterns):
+                    return None
+                prefix = flags.pop()
+                merged = prefix + '|'.join(p[len(prefix):] for p in patterns)
+            else:
+                merged = patterns[0]
+            optimized = factor_alternations(merged, self.min_alternatives)
+        except ValueError:
+            return None
+
+        if optimized == patterns[0] and len(specs) == 1:
+            return None
+
+        samples = list(tests)
+        samples.extend(self.corpus)
+        for pattern in patterns:
+            samples.extend(literal_samples(pattern))
+
+        status, equivalent, speedup = self._verify(patterns, optimized,
+                                                   samples)
+        self.report.append(
+            PatternRewrite(format_name=format_name,
+                           spec_name=name,
+                           original_length=sum(len(p) for p in patterns),
+                           optimized_length=len(optimized),
+                           samples=len(samples),
+                           equivalent=equivalent,
+                           speedup=speedup,
+                           status=status))
+        if status != 'rewritten':
+            return None
+
+        return replace(specs[0],
+                       name=name,
+                       fields=[{
+                           'name': 'value',
+                           'value': optimized
+                       }])
+
+    def optimize(self, format_name: str, tests: Optional[List[Dict]],
+                 specifications: List) -> List:
+        test_inputs = self._test_inputs(tests)
+        optimized = list(specifications)
+
+        if self.merge_conditions:
+            # Radarr/Sonarr OR together non-required specs of the same type,
+            # so those can be folded into a single alternation
+            for implementation in MERGEABLE_IMPLEMENTATIONS:
+                group = [
+                    spec for spec in optimized
+                    if spec.implementation == implementation
+                    and not spec.required and not spec.negate
+                ]
+                if len(group) < 2:
+                    continue
+                merged = self._rewrite_spec(format_name, group, test_inputs)
+                if merged:
+                    position = optimized.index(group[0])
+                    optimized = [
+                        spec for spec in optimized if spec not in group
+                    ]
+                    optimized.insert(position, merged)
+
+        for index, spec in enumerate(optimized):
+            if spec.implementation not in MERGEABLE_IMPLEMENTATIONS:
+                continue
+            rewritten = self._rewrite_spec(format_name, [spec], test_inputs)
+            if rewritten:
+                optimized[index] = rewritten
+
+        return optimized
+
+    def print_report(self) -> None:
+        if not self.report:
+            print("\nPattern optimizer: no candidate patterns")
+            return
+
+        print("\nPattern optimizer report:")
+        for entry in self.report:
+            label = f"{entry.format_name} / {entry.spec_name or '<unnamed>'}"
+            details = [f"{entry.samples} samples"]
+            if entry.equivalent is not None:
+                details.append('equivalent' if entry.equivalent else
+                               'not equivalent')
+            if entry.speedup is not None:
+                details.append(f"{entry.speedup:.2f}x speed")
+            details = ', '.join(details)
+            if entry.status == 'rewritten':
+                print(f"  {label}: {entry.original_length} -> "
+                      f"{entry.optimized_length} chars ({details})")
+            else:
+                print(f"  {label}: kept original ({entry.status}; {details})")
+        rewritten = sum(1 for e in self.report if e.status == 'rewritten')
+        print(f"Rewritten: {rewritten}/{len(self.report)} pattern(s)")
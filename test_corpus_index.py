@@ -0,0 +1,92 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+from corpus_index import CorpusIndex
+
+TABLES = ('patterns', 'formats', 'format_tags', 'specifications',
+          'profiles', 'profile_format_items')
+
+FORMAT = """\
+name: Missing Pattern
+description: test
+tags: [test]
+conditions:
+- name: missing
+  type: release_title
+  pattern: DoesNotExist
+- name: remux
+  type: release_title
+  pattern: Remux
+tests: []
+"""
+
+
+class IncrementalUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.patterns_dir = self.root / 'regex_patterns'
+        self.formats_dir = self.root / 'custom_formats'
+        self.patterns_dir.mkdir()
+        self.formats_dir.mkdir()
+        (self.patterns_dir / 'remux.yml').write_text(
+            'name: Remux\npattern: \\bRemux\\b\n')
+        (self.formats_dir / 'missing.yml').write_text(FORMAT)
+
+        self.index = CorpusIndex(self.root / 'incremental.sqlite')
+        self._update(self.index)
+
+    def tearDown(self):
+        self.index.close()
+        self._tmp.cleanup()
+
+    def _update(self, index: CorpusIndex):
+        return index.update(self.patterns_dir, self.formats_dir, None)
+
+    @staticmethod
+    def _dump(index: CorpusIndex):
+        return {
+            table: sorted(index.query(f"SELECT * FROM {table}")[1],
+                          key=repr)
+            for table in TABLES
+        }
+
+    def assertMatchesRebuild(self):
+        self._update(self.index)
+        rebuilt = CorpusIndex(self.root / "rebuilt.sqlite")
+        try:
+            self._update(rebuilt)
+            self.assertEqual(self._dump(self.index), self._dump(rebuilt))
+        finally:
+            rebuilt.close()
+            (self.root / 'rebuilt.sqlite').unlink()
+
+    def _specification(self, pattern_name: str):
+        return self.index.query(
+            "SELECT implementation, value FROM specifications "
+            "WHERE pattern_name = ? AND app = 'Radarr'", (pattern_name, ))[1]
+
+    def test_pattern_added(self):
+        (self.patterns_dir / 'does_not_exist.yml').write_text(
+            'name: DoesNotExist\npattern: foo\n')
+        self.assertMatchesRebuild()
+        self.assertEqual(self._specification('DoesNotExist'),
+                         [('ReleaseTitleSpecification', 'foo')])
+
+    def test_pattern_removed(self):
+        (self.patterns_dir / 'remux.yml').unlink()
+        self.assertMatchesRebuild()
+        self.assertEqual(self._specification('Remux'), [(None, None)])
+
+    def test_pattern_edited(self):
+        (self.patterns_dir / 'remux.yml').write_text(
+            'name: Remux\npattern: (?i)\\bRemux\\b\n')
+        self.assertMatchesRebuild()
+        self.assertEqual(self._specification('Remux'),
+                         [('ReleaseTitleSpecification', '(?i)\\bRemux\\b')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+from contextlib import redirect_stdout
+from pathlib import Path
+import io
+import tempfile
+import unittest
+
+from format_compile import TargetApp
+from overlay_compile import Overlay, OverlayCompiler
+
+PATTERN = """\
+name: Remux
+pattern: \\bRemux\\b
+"""
+
+FORMAT = """\
+name: {name}
+description: test
+tags: []
+conditions:
+- name: remux
+  type: release_title
+  pattern: Remux
+tests: []
+"""
+
+PROFILE = """\
+name: HD
+qualities:
+- name: Bluray-1080p
+upgrade_until:
+  id: 7
+custom_formats:
+- name: Tier 1
+  score: 100
+- name: Tier 2
+  score: 50
+"""
+
+
+class OverlayExcludeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        for directory in ('regex_patterns', 'custom_formats', 'profiles'):
+            (self.root / directory).mkdir()
+        (self.root / 'regex_patterns' / 'remux.yml').write_text(PATTERN)
+        # File stems deliberately differ from the declared format names
+        (self.root / 'custom_formats' / 'Tier.yml').write_text(
+            FORMAT.format(name='Tier 1'))
+        (self.root / 'custom_formats' / 'Tier2.yml').write_text(
+            FORMAT.format(name='Tier 2'))
+        (self.root / 'profiles' / 'hd.yml').write_text(PROFILE)
+        self.compiler = OverlayCompiler(self.root / 'custom_formats',
+                                        self.root / 'regex_patterns',
+                                        self.root / 'profiles',
+                                        self.root / 'output',
+                                        TargetApp.RADARR)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _compile(self, overlay_yaml: str):
+        overlay_path = self.root / 'instance.yml'
+        overlay_path.write_text(overlay_yaml)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            instance = self.compiler.compile_instance(
+                Overlay.load(overlay_path))
+        return instance, output.getvalue()
+
+    def test_exclude_by_declared_name(self):
+        instance, output = self._compile("exclude_formats: ['Tier 1']\n")
+        format_names = [f['name'] for f in instance.formats.values()]
+        scored = [i['name'] for i in instance.profiles['HD']['formatItems']]
+        self.assertEqual(format_names, ['Tier 2'])
+        self.assertEqual(scored, ['Tier 2'])
+        self.assertNotIn('Warning', output)
+
+    def test_exclude_by_file_stem_warns(self):
+        instance, output = self._compile("exclude_formats: [Tier]\n")
+        format_names = sorted(f['name'] for f in instance.formats.values())
+        scored = [i['name'] for i in instance.profiles['HD']['formatItems']]
+        self.assertEqual(format_names, ['Tier 1', 'Tier 2'])
+        self.assertEqual(scored, ['Tier 1', 'Tier 2'])
+        self.assertIn('excluded format not found: Tier', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from itertools import product
+import random
+import re
+import unittest
+
+from regex_optimize import factor_alternations, literal_samples
+
+
+def _inputs(alphabet: str, max_length: int = 4, extra: int = 2000):
+    """Every short string over alphabet plus random longer ones"""
+    for length in range(max_length + 1):
+        for chars in product(alphabet, repeat=length):
+            yield ''.join(chars)
+    rng = random.Random(0)
+    for _ in range(extra):
+        yield ''.join(
+            rng.choice(alphabet) for _ in range(rng.randint(5, 12)))
+
+
+class FactorAlternationsTest(unittest.TestCase):
+
+    def assertEquivalent(self, pattern: str, alphabet: str) -> str:
+        optimized = factor_alternations(pattern)
+        original_regex = re.compile(pattern)
+        optimized_regex = re.compile(optimized)
+        for text in _inputs(alphabet):
+            # Radarr/Sonarr only ask whether a pattern matches; fullmatch
+            # additionally pins down the language of each alternation
+            for method in ('search', 'fullmatch'):
+                expected = getattr(original_regex, method)(text)
+                actual = getattr(optimized_regex, method)(text)
+                self.assertEqual(
+                    bool(expected), bool(actual),
+                    f"{pattern!r} -> {optimized!r} differs on {text!r}")
+        return optimized
+
+    def test_shared_prefix(self):
+        optimized = self.assertEquivalent('abc|abd|abe', 'abcdex')
+        self.assertEqual(optimized, 'ab[cde]')
+
+    def test_word_boundaries(self):
+        self.assertEquivalent(r'\bab\b|\bac\b|\bad\b', 'abcd -')
+
+    def test_line_anchors(self):
+        self.assertEquivalent(r'^ab|^ac|b$|c$', 'abc')
+
+    def test_optional_suffix(self):
+        optimized = self.assertEquivalent('ab|abc|abcd', 'abcdx')
+        self.assertEqual(optimized, 'ab(?:cd?)?')
+
+    def test_quantified_atoms(self):
+        self.assertEquivalent('a-?b|a-?c|a+d', 'abcd-')
+
+    def test_escaped_class_members(self):
+        self.assertEquivalent(r'a\.|a\-|a\+|a', 'a.-+x')
+
+    def test_empty_alternative(self):
+        self.assertEquivalent('a|ab|', 'abx')
+
+    def test_nested_groups(self):
+        self.assertEquivalent(r'x(?:ab|ac|ad)y|x(?=a)z', 'abcdxyz')
+
+    def test_ignore_case_folding(self):
+        optimized = self.assertEquivalent('(?i)Ab|aC|AD', 'aAbBcCdD')
+        self.assertTrue(optimized.startswith('(?i)'))
+
+    def test_case_kept_without_flag(self):
+        self.assertEquivalent('Ab|aC|AD', 'aAbBcCdD')
+
+    def test_octal_escapes(self):
+        self.assertEquivalent(r'\01|\02|\03', '\0\1\2\3' + '123')
+        self.assertEquivalent(r'\101|\102|\103', 'ABC01')
+        self.assertEquivalent(r'\08|\09|\0a', '\0' + '89a')
+
+    def test_capturing_groups_untouched(self):
+        pattern = '(ab)|(ac)|(ad)'
+        self.assertEqual(factor_alternations(pattern), pattern)
+
+
+class LiteralSamplesTest(unittest.TestCase):
+
+    def test_zero_width_atoms_skipped(self):
+        samples = literal_samples(r'\bRemux\b|\bBlu-?Ray\b')
+        for literal in ('Remux', 'BluRay', 'Blu-Ray'):
+            self.assertIn(literal, samples)
+
+    def test_non_literal_alternatives_skipped(self):
+        self.assertEqual(literal_samples(r'\d+p|[xh]26[45]'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()